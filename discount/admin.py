@@ -2,7 +2,45 @@ from django.contrib import admin
 from discount.models import (
     Customer, CustomerDiscount, Discount, ProductDiscountItem,
     Category, Brand, Product, BrandDiscountItem, CategoryDiscountItem,
-    Order, OrderItem)
+    Order, OrderItem, ProductEffectiveDiscount, ArchivedDiscount,
+    ArchivedDiscountItem, use_materialized)
+from discount.buckets import bucket_counts, bucket_filter, price_buckets
+from discount.paginator import DiscountPaginator
+from django.contrib.admin.views.main import (
+    ALL_VAR, IS_POPUP_VAR, ORDER_VAR, PAGE_VAR, TO_FIELD_VAR)
+
+
+class DiscountListMixin(object):
+    
+    '''
+    changelist of model with discounts does not count annotated queryset
+    when it is not filtered, see DiscountPaginator
+    '''
+    
+    show_full_result_count = False
+    
+    list_params = {ALL_VAR, IS_POPUP_VAR, ORDER_VAR, PAGE_VAR, TO_FIELD_VAR}
+    
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        unfiltered = all(param in self.list_params for param in request.GET)
+        return DiscountPaginator(queryset, per_page, orphans,
+                                 allow_empty_first_page, unfiltered=unfiltered)
+
+
+class SelectRelatedInline(admin.TabularInline):
+    
+    '''
+    rows of inline are read with related objects of select_related, so
+    __str__ of rows does not load them by query per row
+    '''
+    
+    select_related = []
+    
+    def get_queryset(self, request):
+        queryset = super(SelectRelatedInline, self).get_queryset(request)
+        return queryset.select_related(*self.select_related)
+
 
 class OrderProductItemInline(admin.TabularInline):
     model = OrderItem
@@ -10,15 +48,63 @@ class OrderProductItemInline(admin.TabularInline):
     readonly_fields = ['price', 'discount']
 
 
+class OrderAdminTotalFilter(admin.SimpleListFilter):
+    title = 'total cost'
+    parameter_name = 'total'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('to_1000', 'To 1000'),
+            ('from_1000_to_10000', 'From 1000 to 10000'),
+            ('from_10000', 'From 10000'),
+        )
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value == 'to_1000':
+            return queryset.filter(total__lt=1000)
+        if value == 'from_1000_to_10000':
+            return queryset.filter(total__range=(1000,10000))
+        if value == 'from_10000':
+            return queryset.filter(total__gt=10000)
+
+        return queryset
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     inlines = [OrderProductItemInline]
     list_display = ['customer', 'paid', 'discount', 'total_cost', 'created', 'updated']
+    list_filter = ['paid', OrderAdminTotalFilter]
+    list_select_related = ['customer']
     readonly_fields = ['created', 'updated', 'total_cost']
     
+    def get_queryset(self, request):
+        
+        queryset = Order.objects.with_totals()
+        
+        return queryset
+    
+    def total_cost(self, obj):
+        return obj.total_cost()
+    
+    total_cost.admin_order_field = 'total'
+    
+    actions = ['reprice_selected']
+    
+    def reprice_selected(self, request, queryset):
+        from discount.repricing import reprice_orders
+        
+        stats = reprice_orders(orders=queryset.values_list('pk', flat=True))
+        self.message_user(request, 'checked {orders} unpaid orders, changed {changed_orders} '
+                                   'orders and {changed_items} items in {seconds:.2f}s'.format(
+                                       **stats))
+    
+    reprice_selected.short_description = 'Reprice selected unpaid orders by current discounts'
+    
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(DiscountListMixin, admin.ModelAdmin):
     
     list_display = ['name', 'max_discount']
     
@@ -35,7 +121,7 @@ class CustomerAdmin(admin.ModelAdmin):
 
 @admin.register(CustomerDiscount)
 class CustomerDiscountAdmin(admin.ModelAdmin):
-    pass
+    list_select_related = ['customer']
 
 
 @admin.register(Category)
@@ -52,22 +138,32 @@ class ProductAdminPriceDiscountFilter(admin.SimpleListFilter):
     title = 'discount_price'
     parameter_name = 'discount_price'
 
+    def field(self):
+        if use_materialized():
+            return 'effective_discount__discount_price'
+        return 'discount_price'
+
     def lookups(self, request, model_admin):
-        return (
-            ('from_1000_to_100000', 'From 1000 to 10000'),
-        )
+        if not use_materialized():
+            # counting of live discount prices would compute them for every product
+            return [(key, title) for key, title, low, high in price_buckets()]
+        
+        counts = bucket_counts(ProductEffectiveDiscount.objects.all(), 'discount_price')
+        return [
+            (key, '{} ({})'.format(title, counts.get(key, 0)))
+            for key, title, low, high in price_buckets()
+        ]
 
     def queryset(self, request, queryset):
         value = self.value()
-        print(value)
-        if value == 'from_1000_to_100000':
-            return queryset.filter(discount_price__range=(1000,10000))
+        if value:
+            return bucket_filter(queryset, self.field(), value)
 
         return queryset
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(DiscountListMixin, admin.ModelAdmin):
     list_display = [
         'id','name','category','brand','price', 'product_discount',
         'brand_discount', 'category_discount', 'max_discount',
@@ -98,25 +194,58 @@ class ProductAdmin(admin.ModelAdmin):
     def discount_price(self, obj):
         return obj.discount_price
     
+    product_discount.admin_order_field = 'product_discount'
+    brand_discount.admin_order_field = 'brand_discount'
+    category_discount.admin_order_field = 'category_discount'
+    max_discount.admin_order_field = 'max_discount'
     discount_price.admin_order_field = 'discount_price'
     
 
-class CategoryDiscountItemInline(admin.TabularInline):
+class CategoryDiscountItemInline(SelectRelatedInline):
     model = CategoryDiscountItem
+    select_related = ['category']
     raw_id_fields = ['category']
 
 
-class BrandDiscountItemInline(admin.TabularInline):
+class BrandDiscountItemInline(SelectRelatedInline):
     model = BrandDiscountItem
+    select_related = ['brand']
     raw_id_fields = ['brand']
 
 
-class ProductDiscountItemInline(admin.TabularInline):
+class ProductDiscountItemInline(SelectRelatedInline):
     model = ProductDiscountItem
+    select_related = ['product']
     raw_id_fields = ['product']
 
 
 @admin.register(Discount)
 class DiscountAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'valid_from', 'valid_to', 'exclusive']
     inlines = [ProductDiscountItemInline, BrandDiscountItemInline, CategoryDiscountItemInline]
+    actions = ['compact_campaigns']
+    
+    def compact_campaigns(self, request, queryset):
+        from discount.compaction import compact
+        
+        stats = compact(heads=queryset.values_list('pk', flat=True))
+        self.message_user(request, 'archived {archived} campaigns, merged {merged} campaigns, '
+                                   'deleted {dominated} dominated items, {overlapping} items '
+                                   'overlap items of other campaigns'.format(**stats))
+    
+    compact_campaigns.short_description = 'Archive expired, merge and remove dominated items'
+
+
+class ArchivedDiscountItemInline(admin.TabularInline):
+    model = ArchivedDiscountItem
+    readonly_fields = ['level', 'target_id', 'discount']
+    can_delete = False
+    extra = 0
+
+
+@admin.register(ArchivedDiscount)
+class ArchivedDiscountAdmin(admin.ModelAdmin):
+    list_display = ['discount_id', 'valid_from', 'valid_to', 'exclusive', 'archived']
+    readonly_fields = ['discount_id', 'valid_from', 'valid_to', 'exclusive', 'archived']
+    inlines = [ArchivedDiscountItemInline]
     
\ No newline at end of file
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DiscountConfig(AppConfig):
     name = 'discount'
+    
+    def ready(self):
+        import discount.signals  # noqa
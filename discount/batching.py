@@ -0,0 +1,81 @@
+'''
+dataloader of async discount lookups, ids requested by concurrent coroutines
+in the same iteration of event loop are fetched by one query, ids which are
+already being fetched are not requested again (single flight), so a burst of
+requests for the same products costs one query
+
+loaders are kept per event loop, model and database
+'''
+
+import asyncio
+import copy
+import weakref
+
+
+class DiscountLoader(object):
+
+    def __init__(self, fetch):
+        '''
+        fetch is coroutine function, it gets list of ids and returns
+        dict {id: object}
+        '''
+        self.fetch = fetch
+        self.pending = {}
+        self.inflight = {}
+        self.scheduled = False
+
+    async def load_many(self, ids):
+        '''
+        returns dict {id: object} of found ids, every caller gets
+        own copies of objects
+        '''
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for pk in ids:
+            future = self.inflight.get(pk) or self.pending.get(pk)
+            if future is None:
+                future = self.pending[pk] = loop.create_future()
+            futures[pk] = future
+
+        if self.pending and not self.scheduled:
+            self.scheduled = True
+            loop.call_soon(self.dispatch)
+
+        # futures are shared by callers, cancelled caller must not cancel them
+        results = await asyncio.gather(*[asyncio.shield(future) for future in futures.values()])
+        return {pk: copy.copy(obj) for pk, obj in zip(futures, results) if obj is not None}
+
+    def dispatch(self):
+        self.scheduled = False
+        batch, self.pending = self.pending, {}
+        self.inflight.update(batch)
+        asyncio.ensure_future(self.run(batch))
+
+    async def run(self, batch):
+        try:
+            objects = await self.fetch(list(batch))
+        except Exception as exc:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            for pk, future in batch.items():
+                if not future.done():
+                    future.set_result(objects.get(pk))
+        finally:
+            for pk in batch:
+                self.inflight.pop(pk, None)
+
+
+_loaders = weakref.WeakKeyDictionary()
+
+
+def get_loader(manager):
+    '''
+    loader of manager for running event loop
+    '''
+    loaders = _loaders.setdefault(asyncio.get_running_loop(), {})
+    key = (manager.model._meta.label, manager.db)
+    if key not in loaders:
+        loaders[key] = DiscountLoader(manager.afetch_discounts)
+    return loaders[key]
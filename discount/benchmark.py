@@ -0,0 +1,180 @@
+'''
+benchmark of discount apis, every case records amount of queries, size of
+sql, wall time and peak memory of python allocations, results are plain
+dicts, command benchmark_discounts writes them as json
+
+every case is run twice, each run is rolled back: queries and wall time
+are taken from the first run, peak memory from the second run under
+tracemalloc, which slows every allocation down; cases which need
+customers, orders or products are skipped when there are none
+
+concurrency cases compare burst of requests served one after another by
+discount_for with the same burst of concurrent adiscount_for coroutines
+'''
+
+import asyncio
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync
+from django.contrib.admin.sites import site
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from discount.models import (
+    Customer, Order, OrderItem, Product, CustomerEffectiveDiscount,
+    ProductEffectiveDiscount)
+
+
+class Superuser(object):
+
+    '''
+    user of benchmark requests of admin, it has every permission
+    '''
+
+    is_active = True
+    is_staff = True
+    is_superuser = True
+    is_authenticated = True
+    pk = id = 0
+
+    def has_perm(self, perm, obj=None):
+        return True
+
+    def has_perms(self, perms, obj=None):
+        return True
+
+    def has_module_perms(self, app_label):
+        return True
+
+
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(name, func, **info):
+    with rolled_back(), CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+
+    with rolled_back():
+        tracemalloc.start()
+        try:
+            func()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    result = {
+        'case': name,
+        'queries': len(queries.captured_queries),
+        'sql_bytes': sum(len(query['sql']) for query in queries.captured_queries),
+        'seconds': round(seconds, 6),
+        'peak_bytes': peak,
+    }
+    result.update(info)
+    return result
+
+
+def changelist(model, query=''):
+    request = RequestFactory().get('/admin/?' + query)
+    request.user = Superuser()
+    return lambda: site._registry[model].changelist_view(request).render()
+
+
+def sample_ids(model, amount):
+    return list(model.objects.order_by('?').values_list('pk', flat=True)[:amount])
+
+
+def burst(requests, page, seed=0):
+    '''
+    lists of ids of concurrent requests, they overlap as lookups of
+    popular products do
+    '''
+    rnd = random.Random(seed)
+    ids = sample_ids(Product, page * 10)
+    return [rnd.sample(ids, min(page, len(ids))) for i in range(requests)]
+
+
+def sync_requests(bursts):
+    def func():
+        for ids in bursts:
+            Product.objects.discount_for(ids)
+    return func
+
+
+def async_requests(bursts):
+    async def requests():
+        await asyncio.gather(*[Product.objects.adiscount_for(ids) for ids in bursts])
+    return async_to_sync(requests)
+
+
+def cases(page=100, concurrency=500):
+    '''
+    list of (name, function) of benchmarked apis
+    '''
+    product_ids = sample_ids(Product, page)
+    customer = Customer.objects.order_by('?').first()
+    order = Order.objects.first()
+    bursts = burst(concurrency, 10)
+    cart = sample_ids(Product, 10000)
+
+    def save_item():
+        OrderItem(order=order, product_id=product_ids[0], quantity=1).save()
+
+    result = [
+        ('objects_discount page', lambda: list(
+            Product.objects.objects_discount(materialized=False)[:page])),
+        ('objects_discount sorted by discount_price', lambda: list(
+            Product.objects.objects_discount(materialized=False).order_by('discount_price')[:page])),
+        ('objects_discount materialized page', lambda: list(
+            Product.objects.objects_discount(materialized=True)[:page])),
+    ]
+    if product_ids:
+        result += [
+            ('discount_for one product', lambda: Product.objects.discount_for(product_ids[0])),
+            ('discount_for batch', lambda: Product.objects.discount_for(product_ids)),
+        ]
+    if customer is not None:
+        result.append(('customer discount_for', lambda: Customer.objects.discount_for(customer.pk)))
+    if order is not None and product_ids:
+        result.append(('OrderItem.save', save_item))
+    if customer is not None and product_ids:
+        result += [
+            ('create_with_items', lambda: Order.objects.create_with_items(
+                customer, [(pk, 1) for pk in product_ids])),
+            ('price_items cart of {} products'.format(len(cart)), lambda: Order.objects.price_items(
+                customer, [(pk, 1) for pk in cart])),
+        ]
+    result += [
+        ('orders with_totals page', lambda: list(Order.objects.with_totals()[:page])),
+        ('product changelist', changelist(Product)),
+        ('product changelist sorted by discount_price', changelist(Product, 'o=10')),
+        ('customer changelist', changelist(Customer)),
+        ('order changelist', changelist(Order)),
+    ]
+    if product_ids:
+        result += [
+            ('discount_for {} requests'.format(concurrency),
+                sync_requests(bursts)),
+            ('adiscount_for {} concurrent requests'.format(concurrency),
+                async_requests(bursts)),
+        ]
+    result.append(('rebuild materialized discounts', lambda: (
+        ProductEffectiveDiscount.objects.refresh(),
+        CustomerEffectiveDiscount.objects.refresh())))
+    return result
+
+
+def run(page=100, concurrency=500, **info):
+    '''
+    runs every case, see measure
+    '''
+    return [measure(name, func, **info) for name, func in cases(page, concurrency)]
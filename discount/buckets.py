@@ -0,0 +1,58 @@
+'''
+buckets of discount price for admin filter, they are set by setting
+
+DISCOUNT_PRICE_BUCKETS = [(0, 1000), (1000, 10000), (10000, None)]
+
+lower bound is included, upper bound is excluded, None is unlimited,
+with DISCOUNT_MATERIALIZED buckets are counted over indexed column
+ProductEffectiveDiscount.discount_price
+'''
+
+from django.conf import settings
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+
+DEFAULT_BUCKETS = [(0, 1000), (1000, 10000), (10000, None)]
+
+
+def price_buckets():
+    '''
+    list of (key, title, low, high)
+    '''
+    buckets = []
+    for low, high in getattr(settings, 'DISCOUNT_PRICE_BUCKETS', DEFAULT_BUCKETS):
+        if high is None:
+            buckets.append(('from_{}'.format(low), 'From {}'.format(low), low, high))
+        else:
+            buckets.append(('from_{}_to_{}'.format(low, high),
+                            'From {} to {}'.format(low, high), low, high))
+    return buckets
+
+
+def bucket_query(field, low, high):
+    query = Q(**{field + '__gte': low})
+    if high is not None:
+        query &= Q(**{field + '__lt': high})
+    return query
+
+
+def bucket_filter(queryset, field, key):
+    for bucket_key, title, low, high in price_buckets():
+        if bucket_key == key:
+            return queryset.filter(bucket_query(field, low, high))
+    return queryset
+
+
+def bucket_counts(queryset, field):
+    '''
+    dict {key: amount of rows} computed by one grouped query
+    '''
+    bucket = Case(
+        *[When(bucket_query(field, low, high), then=Value(key))
+          for key, title, low, high in price_buckets()],
+        default=Value(''),
+        output_field=CharField()
+    )
+    rows = queryset.order_by().annotate(price_bucket=bucket).values(
+        'price_bucket').annotate(count=Count('pk')).values_list('price_bucket', 'count')
+    return dict(rows)
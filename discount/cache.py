@@ -0,0 +1,194 @@
+'''
+optional in-process cache of discount_for lookups, it is enabled by setting
+
+DISCOUNT_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'default',         # django cache with generation counter
+    'MAX_ENTRIES': 10000,
+    'MAX_BYTES': 16 * 1024 * 1024,
+    'TTL': 300,                 # seconds, capped at next validity boundary
+}
+
+entries are keyed by model, id and discount generation, the generation is
+kept in django cache and bumped after commit of every write to discount
+models, so all workers sharing the django cache drop their entries after
+a change
+'''
+
+import copy
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+GENERATION_KEY = 'discount:generation'
+
+DEFAULTS = {
+    'ENABLED': False,
+    'ALIAS': 'default',
+    'MAX_ENTRIES': 10000,
+    'MAX_BYTES': 16 * 1024 * 1024,
+    'TTL': 300,
+}
+
+
+def cache_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'DISCOUNT_CACHE', {}))
+    return options
+
+
+def get_generation():
+    cache = caches[cache_settings()['ALIAS']]
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+def bump_generation():
+    cache = caches[cache_settings()['ALIAS']]
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+        return cache.incr(GENERATION_KEY)
+
+
+def bump_generation_on_commit(using='default'):
+    '''
+    generation is bumped after commit of current transaction (at once
+    outside of transaction), bumped before commit other workers could
+    cache rows of previous commit under new generation
+    '''
+    transaction.on_commit(bump_generation, using=using)
+
+
+def object_size(obj):
+    return sys.getsizeof(obj) + sum(
+        sys.getsizeof(value) for value in obj.__dict__.values())
+
+
+class DiscountCache(object):
+
+    '''
+    LRU cache of objects with discount fields, entries expire after ttl
+    or at next validity boundary, whichever comes first
+    '''
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generation = None
+        self.expires = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def sync(self):
+        '''
+        drops entries of previous generation or after boundary
+        '''
+        generation = get_generation()
+        now = time.time()
+        if generation == self.generation and now < self.expires:
+            return generation
+
+        from discount.scheduler import next_boundary
+
+        expires = now + self.ttl
+        boundary = next_boundary()
+        if boundary is not None:
+            expires = min(expires, now + max(
+                (boundary - timezone.now()) / timedelta(seconds=1), 0))
+
+        with self.lock:
+            self.clear()
+            self.generation = generation
+            self.expires = expires
+        return generation
+
+    def get_many(self, model, ids):
+        '''
+        returns dict {id: object} of cached objects, list of missing ids
+        and generation of lookup, fetched missing objects are stored
+        by set_many under this generation
+        '''
+        generation = self.sync()
+        label = model._meta.label
+        found = {}
+        missing = []
+        with self.lock:
+            for pk in ids:
+                key = (label, pk, generation)
+                entry = self.entries.get(key)
+                if entry is None:
+                    missing.append(pk)
+                    continue
+                self.entries.move_to_end(key)
+                found[pk] = copy.copy(entry[0])
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing, generation
+
+    def set_many(self, model, objects, generation):
+        '''
+        objects fetched by lookup of older generation are not stored,
+        they could be read before the change which bumped generation
+        '''
+        label = model._meta.label
+        with self.lock:
+            if generation != self.generation:
+                return
+            for pk, obj in objects.items():
+                key = (label, pk, generation)
+                if key in self.entries:
+                    continue
+                size = object_size(obj)
+                self.entries[key] = (copy.copy(obj), size)
+                self.size += size
+            while self.entries and (len(self.entries) > self.max_entries or
+                                    self.size > self.max_bytes):
+                key, (obj, size) = self.entries.popitem(last=False)
+                self.size -= size
+
+
+_discount_cache = None
+
+
+def get_discount_cache():
+    '''
+    cache of current process, None when it is disabled
+    '''
+    global _discount_cache
+    if _discount_cache is None:
+        options = cache_settings()
+        if not options['ENABLED']:
+            return None
+        _discount_cache = DiscountCache(
+            options['MAX_ENTRIES'], options['MAX_BYTES'], options['TTL'])
+    return _discount_cache
+
+
+@receiver(setting_changed)
+def reset_discount_cache(setting, **kwargs):
+    global _discount_cache
+    if setting in ('DISCOUNT_CACHE', 'CACHES'):
+        _discount_cache = None
@@ -0,0 +1,217 @@
+'''
+compaction of discount campaigns, it keeps set of live discount items
+minimal without changing any discount at any moment:
+
+- expired campaigns are moved to ArchivedDiscount, discounts of now never
+  read the archive, discounts at given time and discount.history do;
+  only campaigns which expired before the last run of discount.scheduler
+  are archived, scheduler finds expiries in Discount only
+- campaigns with the same window and exclusivity are merged into one
+- dominated items are deleted, item is dominated when its whole window is
+  covered by windows of other items of the same product, brand or category
+  with the same or higher rank (see discount.rules), so it never changes
+  max rank of its target; they are found by interval sweep from highest
+  rank, of equal items the one with lower id is kept
+
+effective discounts do not change, so signals are muted and materialized
+discounts are not refreshed, only generation of discount cache is bumped
+'''
+
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from discount import signals
+from discount.cache import bump_generation_on_commit
+from discount.models import (
+    DISCOUNT_ITEMS, ArchivedDiscount, ArchivedDiscountItem, Discount, DiscountSchedule)
+from discount.rules import EXCLUSIVE_RANK
+
+
+Item = namedtuple('Item', ['pk', 'head_id', 'valid_from', 'valid_to', 'rank'])
+
+AFTER = timedelta(microseconds=1)
+
+CHUNK_SIZE = 500
+
+
+def chunks(ids, size=CHUNK_SIZE):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def load_items(model, field):
+    '''
+    dict {target id: [Item, ...]} of all items of level
+    '''
+    targets = defaultdict(list)
+    rows = model.objects.values_list(
+        'pk', 'head_id', field, 'discount', 'head__valid_from', 'head__valid_to',
+        'head__exclusive')
+    for pk, head_id, target, discount, start, end, exclusive in rows:
+        targets[target].append(Item(pk, head_id, start, end, discount + EXCLUSIVE_RANK * exclusive))
+    return targets
+
+
+class Coverage(object):
+
+    '''
+    union of closed windows as sorted disjoint intervals
+    '''
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def covers(self, start, end):
+        index = bisect_right(self.starts, start) - 1
+        return index >= 0 and self.ends[index] >= end
+
+    def add(self, start, end):
+        index = bisect_right(self.starts, start) - 1
+        if index >= 0 and self.ends[index] + AFTER >= start:
+            start = self.starts[index]
+        else:
+            index += 1
+        last = index
+        while last < len(self.starts) and self.starts[last] <= end + AFTER:
+            end = max(end, self.ends[last])
+            last += 1
+        self.starts[index:last] = [start]
+        self.ends[index:last] = [end]
+
+
+def dominated(items):
+    '''
+    items of one target which never change its max rank
+    '''
+    coverage = Coverage()
+    result = []
+    for item in sorted(items, key=lambda item: (-item.rank, item.pk)):
+        if coverage.covers(item.valid_from, item.valid_to):
+            result.append(item)
+        else:
+            coverage.add(item.valid_from, item.valid_to)
+    return result
+
+
+def overlapping(items):
+    '''
+    items of one target whose windows overlap window of item of another
+    campaign, found by sweep over valid_from
+    '''
+    result = set()
+    last = None
+    for item in sorted(items, key=lambda item: (item.valid_from, item.pk)):
+        if last is not None and item.valid_from <= last.valid_to and item.head_id != last.head_id:
+            result.update((item.pk, last.pk))
+        if last is None or item.valid_to > last.valid_to:
+            last = item
+    return result
+
+
+def archive_horizon(before):
+    '''
+    time before which expired campaigns can be archived, expiry after
+    processed_until of scheduler is not processed yet, materialized
+    discounts still contain it
+    '''
+    processed = DiscountSchedule.objects.aggregate(until=Min('processed_until'))['until']
+    if processed is None:
+        return before
+    return min(before, processed)
+
+
+def archive_expired(before, heads=None):
+    '''
+    moves campaigns which ended before given time to archive, returns
+    amount of archived campaigns
+    '''
+    expired = Discount.objects.filter(valid_to__lt=before)
+    if heads is not None:
+        expired = expired.filter(pk__in=heads)
+
+    count = 0
+    for chunk in chunks(expired.order_by('pk').values_list('pk', flat=True)):
+        ArchivedDiscount.objects.bulk_create([
+            ArchivedDiscount(discount_id=head.pk, valid_from=head.valid_from,
+                             valid_to=head.valid_to, exclusive=head.exclusive)
+            for head in Discount.objects.filter(pk__in=chunk)
+        ])
+        archived = dict(ArchivedDiscount.objects.filter(
+            discount_id__in=chunk).values_list('discount_id', 'pk'))
+        ArchivedDiscountItem.objects.bulk_create([
+            ArchivedDiscountItem(head_id=archived[head_id], level=level,
+                                 target_id=target_id, discount=discount)
+            for level, model, field in DISCOUNT_ITEMS
+            for head_id, target_id, discount in model.objects.filter(
+                head_id__in=chunk).values_list('head_id', field, 'discount')
+        ])
+        Discount.objects.filter(pk__in=chunk).delete()
+        count += len(chunk)
+    return count
+
+
+def merge_campaigns(heads=None):
+    '''
+    moves items of campaigns with the same window and exclusivity to
+    the campaign with lowest id, returns amount of merged campaigns
+    '''
+    queryset = Discount.objects.all()
+    if heads is not None:
+        queryset = queryset.filter(pk__in=heads)
+
+    groups = queryset.order_by().values('valid_from', 'valid_to', 'exclusive').annotate(
+        amount=Count('pk'), keep=Min('pk')).filter(amount__gt=1)
+    count = 0
+    for group in groups:
+        others = list(queryset.filter(
+            valid_from=group['valid_from'], valid_to=group['valid_to'],
+            exclusive=group['exclusive'],
+        ).exclude(pk=group['keep']).values_list('pk', flat=True))
+        for level, model, field in DISCOUNT_ITEMS:
+            model.objects.filter(head_id__in=others).update(head_id=group['keep'])
+        Discount.objects.filter(pk__in=others).delete()
+        count += len(others)
+    return count
+
+
+def compact(heads=None, archive=True, archive_before=None, dry_run=False):
+    '''
+    compacts campaigns with given ids (all when heads is None), items of
+    other campaigns are used for finding dominated items, but they are
+    not changed; returns dict with amounts of changes
+    '''
+    heads = set(heads) if heads is not None else None
+    stats = {'archived': 0, 'merged': 0, 'dominated': 0, 'overlapping': 0}
+
+    with transaction.atomic(), signals.muted():
+        if archive:
+            stats['archived'] = archive_expired(
+                archive_horizon(archive_before or timezone.now()), heads)
+        stats['merged'] = merge_campaigns(heads)
+
+        for level, model, field in DISCOUNT_ITEMS:
+            removed = []
+            for items in load_items(model, field).values():
+                target_removed = {
+                    item.pk for item in dominated(items)
+                    if heads is None or item.head_id in heads}
+                removed.extend(target_removed)
+                stats['overlapping'] += len(overlapping(
+                    [item for item in items if item.pk not in target_removed]))
+            for chunk in chunks(removed):
+                model.objects.filter(pk__in=chunk).delete()
+            stats['dominated'] += len(removed)
+
+        if dry_run:
+            transaction.set_rollback(True)
+
+    if not dry_run and any(stats[name] for name in ('archived', 'merged', 'dominated')):
+        bump_generation_on_commit()
+    return stats
@@ -0,0 +1,124 @@
+'''
+compiled lookups of discount_for, building and compiling objects_discount
+costs about ten times more than running it, so sql of lookup by ids is
+compiled once per model, database, vendor, stacking settings and size
+and kept by lru_cache, every call only fills ids into parameters
+
+sizes are rounded up to power of two and ids are padded by the first id,
+so few shapes of sql are compiled; rows are converted by converters of
+compiler and turned into instances as QuerySet does, current time is
+computed by database (see DiscountNow), so compiled sql never gets stale
+
+lookups bigger than MAX_SIZE are not compiled, they are one query of
+objects_discount on backends without limit of parameters (postgresql)
+and batches filling max_query_params on others (sqlite)
+
+this module is imported on first lookup
+'''
+
+from functools import lru_cache
+
+from django.apps import apps
+from django.db import connections
+
+from discount.rules import stacking_settings
+
+
+# ids of compilation, they are replaced by ids of lookup
+PLACEHOLDER = -(10 ** 15)
+
+MAX_SIZE = 1024
+
+
+def settings_key():
+    options = stacking_settings()
+    return tuple(sorted(
+        (name, tuple(value) if isinstance(value, list) else value)
+        for name, value in options.items()))
+
+
+def shape(size):
+    rounded = 1
+    while rounded < size:
+        rounded *= 2
+    return rounded
+
+
+class CompiledLookup(object):
+
+    def __init__(self, queryset, size):
+        placeholders = [PLACEHOLDER - i for i in range(size)]
+        compiler = queryset.filter(pk__in=placeholders).query.get_compiler(queryset.db)
+        self.sql, params = compiler.as_sql()
+        self.params = list(params)
+        self.positions = [self.params.index(placeholder) for placeholder in placeholders]
+        self.db = queryset.db
+
+        klass_info = compiler.klass_info
+        self.model = klass_info['model']
+        start, end = klass_info['select_fields'][0], klass_info['select_fields'][-1] + 1
+        self.fields = slice(start, end)
+        self.field_names = [column[0].target.attname for column in compiler.select[start:end]]
+        self.annotations = list(compiler.annotation_col_map.items())
+        self.compiler = compiler
+        self.converters = compiler.get_converters([column[0] for column in compiler.select])
+
+    def execute(self, ids):
+        '''
+        dict {id: instance with annotations}, len(ids) is at most size
+        '''
+        params = list(self.params)
+        for position, pk in zip(self.positions, ids + ids[:1] * (len(self.positions) - len(ids))):
+            params[position] = pk
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(self.sql, params)
+            rows = cursor.fetchall()
+        if self.converters:
+            rows = self.compiler.apply_converters(rows, self.converters)
+
+        objects = {}
+        for row in rows:
+            obj = self.model.from_db(self.db, self.field_names, row[self.fields])
+            for name, position in self.annotations:
+                setattr(obj, name, row[position])
+            objects[obj.pk] = obj
+        return objects
+
+
+@lru_cache(maxsize=64)
+def compiled_lookup(label, alias, vendor, materialized, options, size):
+    '''
+    vendor and options are parts of key only, sql differs for them
+    '''
+    model = apps.get_model(label)
+    return CompiledLookup(
+        model.objects.db_manager(alias).objects_discount(materialized).order_by(), size)
+
+
+def fetch(manager, ids, materialized):
+    '''
+    dict {id: instance} of objects_discount of manager for given ids
+    '''
+    ids = list(ids)
+    if not ids:
+        return {}
+    connection = connections[manager.db]
+    max_params = connection.features.max_query_params
+    # half of parameters is left for constants of discount expressions
+    limit = MAX_SIZE
+    while max_params and limit > max_params // 2:
+        limit //= 2
+    key = (manager.model._meta.label, manager.db, connection.vendor, materialized,
+           settings_key())
+    if len(ids) <= limit:
+        return compiled_lookup(*key, shape(len(ids))).execute(ids)
+
+    batch_size = len(ids)
+    if max_params:
+        constants = len(compiled_lookup(*key, 1).params) - 1
+        batch_size = max_params - constants
+    queryset = manager.objects_discount(materialized).order_by()
+    objects = {}
+    for i in range(0, len(ids), batch_size):
+        objects.update((obj.pk, obj) for obj in queryset.filter(pk__in=ids[i:i + batch_size]))
+    return objects
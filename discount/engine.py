@@ -0,0 +1,243 @@
+'''
+vectorized pricing of whole catalogue for bulk repricing (feeds, nightly
+rebuilds), discounts are computed from columns of products and ranks of
+discount levels instead of model instances and Decimal math
+
+ranks of current discount items are loaded by one grouped query per level
+into dense arrays indexed by id of product, brand or category, products are
+read by keyset pagination in chunks of (id, price in cents, brand_id,
+category_id), so memory depends on chunk size and highest ids only
+
+prices are integers in cents and discount price is rounded half up to cent,
+as ROUND(..., 2) of database does, stacking follows discount.rules; numpy is
+used when it is installed, otherwise module array and plain python
+'''
+
+import operator
+from array import array
+from decimal import Decimal
+from functools import reduce
+
+from django.db import connections, router, transaction
+from django.db.models import F, Func, IntegerField, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from discount.cache import bump_generation_on_commit
+from discount.expressions import archived_discount_items, current_discount_items, max_rank
+from discount.models import (
+    DISCOUNT_ITEMS, ArchivedDiscountItem, Product, ProductEffectiveDiscount)
+from discount.rules import (
+    EXCLUSIVE_RANK, POLICIES, by_priority, stacked_discount, stacking_settings)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+ENGINE_FIELDS = [
+    'id', 'price', 'product_discount', 'brand_discount', 'category_discount',
+    'exclusive', 'max_discount', 'discount_price',
+]
+
+def load_ranks(level, model, field, use_numpy, at=None):
+    '''
+    dense array {id: max rank of current items} of one level, with at
+    items of archived campaigns are ranked too
+    '''
+    ranks = dict(current_discount_items(model, at).order_by().values(field).annotate(
+        rank=max_rank(EXCLUSIVE_RANK)).values_list(field, 'rank'))
+    if at is not None:
+        archived = archived_discount_items(ArchivedDiscountItem, level, at).order_by().values(
+            'target_id').annotate(rank=max_rank(EXCLUSIVE_RANK)).values_list('target_id', 'rank')
+        for key, rank in archived:
+            ranks[key] = max(ranks.get(key, 0), rank)
+    size = max(ranks, default=0) + 1
+    if use_numpy:
+        dense = numpy.zeros(size, dtype=numpy.int64)
+        dense[numpy.fromiter(ranks.keys(), numpy.int64, len(ranks))] = numpy.fromiter(
+            ranks.values(), numpy.int64, len(ranks))
+    else:
+        dense = array('l', bytes(array('l').itemsize * size))
+        for key, rank in ranks.items():
+            dense[key] = rank
+    return dense
+
+
+def numpy_priority(values):
+    result = values[-1]
+    for value in reversed(values[:-1]):
+        result = numpy.where(value > 0, value, result)
+    return result
+
+
+NUMPY_POLICIES = {
+    'max': lambda values: reduce(numpy.maximum, values),
+    'additive': lambda values: reduce(operator.add, values),
+    'multiplicative': POLICIES['multiplicative'][1],
+    'priority': numpy_priority,
+}
+
+
+class PricingEngine(object):
+
+    '''
+    engine = PricingEngine()
+    for columns in engine.chunks():
+        ...
+    '''
+
+    def __init__(self, chunk_size=100000, use_numpy=None, at=None):
+        self.chunk_size = chunk_size
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        if self.use_numpy and numpy is None:
+            raise ImportError('numpy is not installed')
+        self.options = stacking_settings()
+        self.ranks = {
+            level: load_ranks(level, model, field, self.use_numpy, at)
+            for level, model, field in DISCOUNT_ITEMS
+        }
+
+    def products(self):
+        '''
+        chunks of rows (id, price in cents, brand_id, category_id)
+        '''
+        cents = Cast(Func(F('price') * Value(100), function='ROUND'), IntegerField())
+        queryset = Product.objects.order_by('pk').annotate(cents=cents).values_list(
+            'pk', 'cents', 'brand_id', 'category_id')
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_id)[:self.chunk_size])
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+
+    def chunks(self):
+        '''
+        dicts of columns ENGINE_FIELDS, price and discount_price are in cents
+        '''
+        compute = self.compute_numpy if self.use_numpy else self.compute_array
+        for rows in self.products():
+            yield compute(rows)
+
+    def compute_numpy(self, rows):
+        columns = numpy.array(rows, dtype=numpy.int64).T
+        ids, cents, brands, categories = columns
+        keys = {'product': ids, 'brand': brands, 'category': categories}
+
+        ranks = {}
+        for level, dense in self.ranks.items():
+            key = keys[level]
+            inside = key < len(dense)
+            ranks[level] = numpy.where(inside, dense[numpy.where(inside, key, 0)], 0)
+
+        levels = {level: rank % EXCLUSIVE_RANK for level, rank in ranks.items()}
+        top = reduce(numpy.maximum, ranks.values())
+        exclusive = top >= EXCLUSIVE_RANK
+        stacked = NUMPY_POLICIES[self.options['POLICY']](by_priority(levels, self.options))
+        stacked = numpy.minimum(stacked, self.options['CAP'])
+        discount = numpy.where(exclusive, top - EXCLUSIVE_RANK, stacked)
+
+        return {
+            'id': ids,
+            'price': cents,
+            'product_discount': levels['product'],
+            'brand_discount': levels['brand'],
+            'category_discount': levels['category'],
+            'exclusive': exclusive,
+            'max_discount': discount,
+            'discount_price': (cents * (100 - discount) + 50) // 100,
+        }
+
+    def compute_array(self, rows):
+        columns = {field: array('l') for field in ENGINE_FIELDS}
+        columns['exclusive'] = array('b')
+        for pk, cents, brand_id, category_id in rows:
+            ranks = {}
+            for level, key in (('product', pk), ('brand', brand_id), ('category', category_id)):
+                dense = self.ranks[level]
+                ranks[level] = dense[key] if key < len(dense) else 0
+            levels = {level: rank % EXCLUSIVE_RANK for level, rank in ranks.items()}
+            top = max(ranks.values())
+            if top >= EXCLUSIVE_RANK:
+                discount = top - EXCLUSIVE_RANK
+            else:
+                discount = stacked_discount(levels)
+
+            columns['id'].append(pk)
+            columns['price'].append(cents)
+            columns['product_discount'].append(levels['product'])
+            columns['brand_discount'].append(levels['brand'])
+            columns['category_discount'].append(levels['category'])
+            columns['exclusive'].append(top >= EXCLUSIVE_RANK)
+            columns['max_discount'].append(discount)
+            columns['discount_price'].append((cents * (100 - discount) + 50) // 100)
+        return columns
+
+
+def to_money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def rows(columns):
+    '''
+    tuples of ENGINE_FIELDS of chunk with prices in Decimal
+    '''
+    for values in zip(*[columns[field] for field in ENGINE_FIELDS]):
+        pk, price, product, brand, category, exclusive, discount, discount_price = values
+        yield (int(pk), to_money(price), int(product), int(brand), int(category),
+               bool(exclusive), int(discount), to_money(discount_price))
+
+
+def iter_prices(chunk_size=100000, use_numpy=None, at=None):
+    '''
+    rows of ENGINE_FIELDS, with at prices valid at given time
+    '''
+    for columns in PricingEngine(chunk_size, use_numpy, at).chunks():
+        yield from rows(columns)
+
+
+WRITE_FIELDS = [
+    'product', 'product_discount', 'brand_discount', 'category_discount',
+    'exclusive', 'max_discount', 'discount_price', 'updated',
+]
+
+
+def insert_sql(connection):
+    opts = ProductEffectiveDiscount._meta
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(opts.db_table),
+        ', '.join(connection.ops.quote_name(opts.get_field(name).column)
+                  for name in WRITE_FIELDS),
+        ', '.join(['%s'] * len(WRITE_FIELDS)))
+
+
+def write_materialized(chunk_size=100000, use_numpy=None, batch_size=2000):
+    '''
+    replaces ProductEffectiveDiscount of every product by results of engine,
+    returns amount of written rows; values of engine are plain already,
+    so they are inserted by executemany without model instances,
+    generation of discount cache is bumped after commit
+    '''
+    connection = connections[router.db_for_write(ProductEffectiveDiscount)]
+    sql = insert_sql(connection)
+    updated = connection.ops.adapt_datetimefield_value(timezone.now())
+    count = 0
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        ProductEffectiveDiscount.objects.using(connection.alias).exclude(
+            pk__in=Product.objects.values('pk')).delete()
+        for columns in PricingEngine(chunk_size, use_numpy).chunks():
+            params = [
+                (pk, product, brand, category, exclusive, discount, discount_price, updated)
+                for pk, price, product, brand, category, exclusive, discount, discount_price
+                in rows(columns)
+            ]
+            ProductEffectiveDiscount.objects.using(connection.alias).filter(
+                product_id__gte=params[0][0], product_id__lte=params[-1][0]).delete()
+            for i in range(0, len(params), batch_size):
+                cursor.executemany(sql, params[i:i + batch_size])
+            count += len(params)
+    bump_generation_on_commit(connection.alias)
+    return count
@@ -0,0 +1,77 @@
+'''
+streaming export of products with discounts, products are read by keyset
+pagination over id and discounts are computed per chunk, so memory does not
+depend on size of catalogue and first rows are written immediately
+'''
+
+import csv
+import json
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from discount.models import Product
+
+
+EXPORT_FIELDS = [
+    'id', 'name', 'brand', 'category', 'price', 'product_discount',
+    'brand_discount', 'category_discount', 'max_discount', 'discount_price',
+]
+
+QUERY_FIELDS = [
+    'id', 'name', 'brand__name', 'category__name', 'price', 'product_discount',
+    'brand_discount', 'category_discount', 'max_discount', 'discount_price',
+]
+
+
+CENT = Decimal('0.01')
+
+
+def iter_products(chunk_size=1000, materialized=None):
+    '''
+    yields tuples of EXPORT_FIELDS ordered by id, prices are rounded to cents
+    because sqlite returns computed decimals with extra digits
+    '''
+    queryset = Product.objects.objects_discount(materialized).order_by('pk')
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_id).values_list(
+            *QUERY_FIELDS)[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        for row in chunk:
+            yield row[:4] + (row[4].quantize(CENT),) + row[5:9] + (row[9].quantize(CENT),)
+
+
+class Echo(object):
+    
+    '''
+    file-like object for csv.writer, it returns written line
+    '''
+    
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields=EXPORT_FIELDS):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows, fields=EXPORT_FIELDS):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'jsonl': (jsonl_lines, 'application/x-ndjson'),
+}
+
+
+def export_lines(format='csv', chunk_size=1000, materialized=None):
+    lines, content_type = FORMATS[format]
+    return lines(iter_products(chunk_size=chunk_size, materialized=materialized))
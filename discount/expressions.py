@@ -0,0 +1,164 @@
+'''
+expressions of discount computation, they are compiled for every database
+backend by django, so the same querysets work on sqlite, postgresql and mysql:
+Greatest is max(,,,) on sqlite and greatest(,,,) on postgresql and mysql,
+its arguments are always wrapped by Coalesce, because greatest() ignores
+NULL on postgresql and returns NULL on sqlite and mysql
+'''
+
+from decimal import Decimal
+
+from django.db.models import (
+    Case, DateTimeField, DecimalField, F, Func, IntegerField, Max, OuterRef, Subquery, Sum,
+    Value, When)
+from django.db.models.functions import Coalesce, Greatest, Least, Now
+
+
+PRICE_FIELD = DecimalField(max_digits=10, decimal_places=2)
+TOTAL_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+class DiscountNow(Now):
+    
+    '''
+    current time with fractions of second on every backend, stored datetimes
+    have microseconds, on sqlite CURRENT_TIMESTAMP has only seconds
+    and on postgresql it is time of transaction start
+    '''
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+                           template="STRFTIME('%%%%Y-%%%%m-%%%%d %%%%H:%%%%M:%%%%f', 'NOW')",
+                           **extra_context)
+    
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+                           template='STATEMENT_TIMESTAMP()', **extra_context)
+    
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+                           template='CURRENT_TIMESTAMP(6)', **extra_context)
+
+
+class IntegerDivision(Func):
+    
+    '''
+    division of integers without remainder, on mysql / returns decimal
+    '''
+    
+    arg_joiner = ' / '
+    template = '(%(expressions)s)'
+    output_field = IntegerField()
+    
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, arg_joiner=' DIV ', **extra_context)
+
+
+def round_price(expression):
+    return Func(expression, 2, function='ROUND', output_field=PRICE_FIELD)
+
+
+def percent_of(expression, discount):
+    '''
+    multiplying by 0.01 instead of dividing by 100 keeps decimals on sqlite,
+    where integer prices are stored as integers
+    '''
+    return expression * discount * Value(Decimal('0.01'))
+
+
+def discount_price(price, discount):
+    '''
+    price is multiplied by paid percent, price - percent_of(price, discount)
+    is float on sqlite and some halves of cent are rounded down by it,
+    e.g. 0.34 instead of 0.35 for 1.15 with discount 70
+    '''
+    return round_price(percent_of(price, Value(100) - discount))
+
+
+def max_of(*expressions):
+    return Greatest(*[Coalesce(expression, 0) for expression in expressions],
+                    output_field=IntegerField())
+
+
+def min_of(*expressions):
+    return Least(*expressions, output_field=IntegerField())
+
+
+def moment(at=None):
+    '''
+    now by database or given point in time
+    '''
+    if at is None:
+        return DiscountNow()
+    return Value(at, output_field=DateTimeField())
+
+
+def current_discount_items(model, at=None):
+    '''
+    items of discounts (product, brand or category) which are valid now
+    or at given time
+    '''
+    return model.objects.filter(head__valid_from__lte=moment(at),
+                                head__valid_to__gte=moment(at))
+
+
+def archived_discount_items(model, level, at):
+    '''
+    items of archived campaigns of level (see discount.compaction) which
+    were valid at given time, they have target_id instead of foreign key
+    '''
+    return model.objects.filter(level=level, head__valid_from__lte=moment(at),
+                                head__valid_to__gte=moment(at))
+
+
+def current_customer_discounts(model, at=None):
+    return model.objects.filter(valid_from__lte=moment(at),
+                                valid_to__gte=moment(at))
+
+
+def sum_subquery(queryset, expression):
+    '''
+    correlated subquery with sum of expression over rows of queryset,
+    queryset has to be grouped by values()
+    '''
+    queryset = queryset.annotate(
+        total=Sum(expression, output_field=TOTAL_FIELD)
+    ).values('total')
+    
+    return Subquery(queryset, output_field=TOTAL_FIELD)
+
+
+def max_discount_subquery(queryset, field, outer_field):
+    '''
+    correlated subquery with max discount of queryset rows related to
+    outer_field of main queryset, the size of sql does not depend on
+    amount of rows, filtering and slicing are made by database
+    '''
+    queryset = queryset.filter(**{field: OuterRef(outer_field)}).order_by()
+    queryset = queryset.values(field).annotate(
+        max_discount=Max('discount')).values('max_discount')
+    
+    return Coalesce(Subquery(queryset, output_field=IntegerField()), 0)
+
+
+def max_rank(exclusive_rank):
+    '''
+    max discount of items, discounts of exclusive campaigns are increased
+    by exclusive_rank
+    '''
+    rank = F('discount') + Case(When(head__exclusive=True, then=Value(exclusive_rank)),
+                                default=Value(0))
+    return Max(rank, output_field=IntegerField())
+
+
+def max_rank_subquery(queryset, field, outer_field, exclusive_rank):
+    '''
+    max_discount_subquery where discounts of exclusive campaigns are
+    increased by exclusive_rank, so one subquery tells both max discount
+    and whether it is exclusive, exclusive discount wins over any other
+    '''
+    queryset = queryset.filter(**{field: OuterRef(outer_field)}).order_by()
+    queryset = queryset.values(field).annotate(
+        max_rank=max_rank(exclusive_rank)).values('max_rank')
+    
+    return Coalesce(Subquery(queryset, output_field=IntegerField()), 0)
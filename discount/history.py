@@ -0,0 +1,214 @@
+'''
+history of discounts: timelines of discounts between two moments and audit
+of orders against discounts which were valid when orders were created
+
+items whose validity windows overlap [since, until] are read by one query
+per level and chunk of ids from live and archived discounts (see
+discount.compaction), they are found by interval indexes
+(valid_to, valid_from) of Discount and (customer, valid_to, valid_from) of
+CustomerDiscount, then discounts are evaluated in python at every boundary
+of windows, so timeline of any length costs the same queries
+
+window is valid including valid_to, so discount changes at valid_from
+and one microsecond after valid_to
+'''
+
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from discount.models import (
+    ArchivedDiscountItem, BrandDiscountItem, CategoryDiscountItem, CustomerDiscount,
+    OrderItem, Product, ProductDiscountItem)
+from discount.rules import EXCLUSIVE_RANK, item_discount, order_discount, stacked_discount
+
+
+ProductPoint = namedtuple('ProductPoint', [
+    'at', 'product_discount', 'brand_discount', 'category_discount',
+    'exclusive', 'max_discount', 'discount_price'])
+
+CustomerPoint = namedtuple('CustomerPoint', ['at', 'max_discount'])
+
+CHUNK_SIZE = 1000
+
+CENT = Decimal('0.01')
+
+AFTER = timedelta(microseconds=1)
+
+
+def parse_moment(value):
+    '''
+    aware datetime from iso string, naive time is in current time zone
+    '''
+    at = parse_datetime(value)
+    if at is None:
+        raise ValueError('{} is not date and time'.format(value))
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    return at
+
+
+def chunks(ids, size=CHUNK_SIZE):
+    ids = sorted(set(ids))
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def item_windows(level, model, field, ids, since, until, using):
+    '''
+    dict {id: [(valid_from, valid_to, rank), ...]} of items of discounts
+    and archived discounts overlapping [since, until]
+    '''
+    windows = defaultdict(list)
+    rows = list(model.objects.using(using).filter(**{
+        field + '__in': ids,
+        'head__valid_to__gte': since,
+        'head__valid_from__lte': until,
+    }).values_list(field, 'head__valid_from', 'head__valid_to', 'discount', 'head__exclusive'))
+    rows += ArchivedDiscountItem.objects.using(using).filter(
+        level=level, target_id__in=ids, head__valid_to__gte=since, head__valid_from__lte=until,
+    ).values_list('target_id', 'head__valid_from', 'head__valid_to', 'discount', 'head__exclusive')
+    for key, start, end, discount, exclusive in rows:
+        windows[key].append((start, end, discount + EXCLUSIVE_RANK * exclusive))
+    return windows
+
+
+def rank_at(windows, at):
+    return max((rank for start, end, rank in windows if start <= at <= end), default=0)
+
+
+def boundaries(windows, since, until):
+    moments = {since}
+    for start, end, rank in windows:
+        if since < start <= until:
+            moments.add(start)
+        if since < end + AFTER <= until:
+            moments.add(end + AFTER)
+    return sorted(moments)
+
+
+def product_point(at, price, ranks):
+    levels = {level: rank % EXCLUSIVE_RANK for level, rank in ranks.items()}
+    top = max(ranks.values())
+    exclusive = top >= EXCLUSIVE_RANK
+    discount = top - EXCLUSIVE_RANK if exclusive else stacked_discount(levels)
+    discount_price = (price * (100 - discount) / 100).quantize(CENT, ROUND_HALF_UP)
+    return ProductPoint(at, levels['product'], levels['brand'], levels['category'],
+                        exclusive, discount, discount_price)
+
+
+def compact(points):
+    '''
+    drops points which do not change discounts
+    '''
+    result = []
+    for point in points:
+        if not result or point[1:] != result[-1][1:]:
+            result.append(point)
+    return result
+
+
+def product_timelines(ids, since, until, using='default'):
+    '''
+    dict {product_id: [ProductPoint, ...]}, every point is valid from its
+    time until time of next point, first point is at since; current price
+    of product is used, history of prices is not kept
+    '''
+    timelines = {}
+    for chunk in chunks(ids):
+        products = {
+            pk: (brand_id, category_id, price)
+            for pk, brand_id, category_id, price in Product.objects.using(using).filter(
+                pk__in=chunk).values_list('pk', 'brand_id', 'category_id', 'price')
+        }
+        product_windows = item_windows(
+            'product', ProductDiscountItem, 'product_id', chunk, since, until, using)
+        brand_windows = item_windows(
+            'brand', BrandDiscountItem, 'brand_id', {row[0] for row in products.values()},
+            since, until, using)
+        category_windows = item_windows(
+            'category', CategoryDiscountItem, 'category_id', {row[1] for row in products.values()},
+            since, until, using)
+
+        for pk, (brand_id, category_id, price) in products.items():
+            levels = {
+                'product': product_windows.get(pk, []),
+                'brand': brand_windows.get(brand_id, []),
+                'category': category_windows.get(category_id, []),
+            }
+            moments = boundaries(sum(levels.values(), []), since, until)
+            timelines[pk] = compact([
+                product_point(at, price, {
+                    level: rank_at(windows, at) for level, windows in levels.items()})
+                for at in moments
+            ])
+    return timelines
+
+
+def customer_timelines(ids, since, until, using='default'):
+    '''
+    dict {customer_id: [CustomerPoint, ...]} of max discount of customer
+    '''
+    timelines = {}
+    for chunk in chunks(ids):
+        windows = defaultdict(list)
+        rows = CustomerDiscount.objects.using(using).filter(
+            customer_id__in=chunk, valid_to__gte=since, valid_from__lte=until,
+        ).values_list('customer_id', 'valid_from', 'valid_to', 'discount')
+        for customer_id, start, end, discount in rows:
+            windows[customer_id].append((start, end, discount))
+
+        for pk in chunk:
+            moments = boundaries(windows[pk], since, until)
+            timelines[pk] = compact([
+                CustomerPoint(at, rank_at(windows[pk], at)) for at in moments])
+    return timelines
+
+
+TIMELINES = {
+    'product': product_timelines,
+    'customer': customer_timelines,
+}
+
+
+def point_at(timeline, at):
+    '''
+    point of timeline valid at given time
+    '''
+    index = bisect_right([point.at for point in timeline], at) - 1
+    return timeline[max(index, 0)]
+
+
+def audit_orders(since, until, using='default'):
+    '''
+    yields dicts of order items created between since and until whose
+    discounts differ from discounts valid at creation of their orders
+    '''
+    items = list(OrderItem.objects.using(using).filter(
+        order__created__gte=since, order__created__lte=until,
+    ).order_by('order_id', 'pk').values_list(
+        'pk', 'order_id', 'order__created', 'order__customer_id', 'order__discount',
+        'product_id', 'discount'))
+
+    products = product_timelines({item[5] for item in items}, since, until, using)
+    customers = customer_timelines({item[3] for item in items}, since, until, using)
+
+    for pk, order_id, created, customer_id, order_disc, product_id, item_disc in items:
+        customer = point_at(customers[customer_id], created)
+        expected_item = item_discount(point_at(products[product_id], created), customer)
+        expected_order = order_discount(customer)
+        if (item_disc, order_disc) != (expected_item, expected_order):
+            yield {
+                'order': order_id,
+                'item': pk,
+                'created': created,
+                'product': product_id,
+                'discount': item_disc,
+                'expected_discount': expected_item,
+                'order_discount': order_disc,
+                'expected_order_discount': expected_order,
+            }
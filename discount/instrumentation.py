@@ -0,0 +1,170 @@
+'''
+instrumentation of discount resolution, every instrumented call sends signal
+discount_resolved with stats: api, queries, sql_bytes, rows_returned,
+seconds, cache_hits, cache_misses; DiscountInstrumentationMiddleware sums
+stats of request, adds them to response headers and logs requests over budget
+
+rows_returned are rows given to caller, rows scanned by database are not
+reported, backends tell them only by EXPLAIN ANALYZE, which runs the query
+again, see explain_discounts --analyze
+
+DISCOUNT_INSTRUMENTATION = {
+    'HEADERS': True,
+    'BUDGET': {'queries': 20, 'seconds': 0.2},
+}
+
+when signal has no receivers and middleware is not collecting,
+instrument() does nothing except one check
+'''
+
+import logging
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+
+
+logger = logging.getLogger('discount.instrumentation')
+
+discount_resolved = Signal()
+
+_collector = ContextVar('discount_collector', default=None)
+_depth = ContextVar('discount_depth', default=0)
+
+STATS_FIELDS = (
+    'queries', 'sql_bytes', 'rows_returned', 'seconds', 'cache_hits', 'cache_misses')
+
+
+def enabled():
+    return _collector.get() is not None or discount_resolved.has_listeners()
+
+
+class QueryCounter(object):
+
+    '''
+    execute wrapper of connection, it counts queries and bytes of sql
+    '''
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __call__(self, execute, sql, params, many, context):
+        self.stats['queries'] += 1
+        self.stats['sql_bytes'] += len(sql)
+        return execute(sql, params, many, context)
+
+
+class NoStats(dict):
+
+    '''
+    stats of disabled instrumentation, writes are ignored
+    '''
+
+    def __setitem__(self, key, value):
+        pass
+
+
+NO_STATS = NoStats()
+
+
+class instrument(object):
+
+    '''
+    with instrument('discount_for') as stats:
+        stats['rows_returned'] = len(objects)
+    '''
+
+    def __init__(self, api, using='default'):
+        self.api = api
+        self.using = using
+        self.stats = None
+
+    def __enter__(self):
+        if not enabled():
+            return NO_STATS
+
+        self.stats = stats = dict.fromkeys(STATS_FIELDS, 0)
+        stats['api'] = self.api
+        self.depth = _depth.set(_depth.get() + 1)
+        self.wrapper = connections[self.using].execute_wrapper(QueryCounter(stats))
+        self.wrapper.__enter__()
+        self.start = time.perf_counter()
+        return stats
+
+    def __exit__(self, *exc_info):
+        stats = self.stats
+        if stats is None:
+            return
+
+        stats['seconds'] = time.perf_counter() - self.start
+        self.wrapper.__exit__(*exc_info)
+        stats['nested'] = _depth.get() > 1
+        _depth.reset(self.depth)
+        collector = _collector.get()
+        if collector is not None:
+            collector.append(stats)
+        discount_resolved.send(sender=None, **stats)
+
+
+def instrumentation_settings():
+    options = {'HEADERS': True, 'BUDGET': {}}
+    options.update(getattr(settings, 'DISCOUNT_INSTRUMENTATION', {}))
+    return options
+
+
+def summarize(collected):
+    '''
+    totals of calls, nested calls are already counted by outer calls
+    '''
+    totals = dict.fromkeys(STATS_FIELDS, 0)
+    totals['calls'] = 0
+    for stats in collected:
+        if stats['nested']:
+            continue
+        totals['calls'] += 1
+        for field in STATS_FIELDS:
+            totals[field] += stats[field]
+    return totals
+
+
+class DiscountInstrumentationMiddleware(object):
+
+    '''
+    collects stats of discount resolution of request
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collected = []
+        token = _collector.set(collected)
+        try:
+            response = self.get_response(request)
+        finally:
+            _collector.reset(token)
+
+        if not collected:
+            return response
+
+        options = instrumentation_settings()
+        totals = summarize(collected)
+
+        if options['HEADERS']:
+            response['X-Discount-Calls'] = totals['calls']
+            response['X-Discount-Queries'] = totals['queries']
+            response['X-Discount-Sql-Bytes'] = totals['sql_bytes']
+            response['X-Discount-Rows'] = totals['rows_returned']
+            response['X-Discount-Time'] = '{:.6f}'.format(totals['seconds'])
+            response['X-Discount-Cache'] = '{}/{}'.format(
+                totals['cache_hits'], totals['cache_misses'])
+
+        exceeded = [name for name, limit in options['BUDGET'].items()
+                    if totals.get(name, 0) > limit]
+        if exceeded:
+            logger.warning('discount budget exceeded (%s) %s %s: %s',
+                           ', '.join(exceeded), request.method, request.path, totals)
+
+        return response
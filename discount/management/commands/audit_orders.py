@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from discount.history import audit_orders, parse_moment
+
+
+class Command(BaseCommand):
+    
+    help = ('Compares discounts of orders created in period with discounts '
+            'which were valid when orders were created')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=parse_moment,
+                            help='start of period, 30 days ago by default')
+        parser.add_argument('--until', type=parse_moment, help='end of period, now by default')
+    
+    def handle(self, *args, **options):
+        until = options['until'] or timezone.now()
+        since = options['since'] or until - timedelta(days=30)
+        
+        errors = 0
+        for row in audit_orders(since, until):
+            errors += 1
+            self.stdout.write('order {order} item {item} product {product} at {created}: '
+                              'discount {discount} expected {expected_discount}, '
+                              'order discount {order_discount} expected '
+                              '{expected_order_discount}'.format(**row))
+        self.stdout.write('{} order items differ from discounts valid at their orders'.format(errors))
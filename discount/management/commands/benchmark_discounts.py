@@ -0,0 +1,50 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from discount import benchmark
+from discount.models import CustomerEffectiveDiscount, ProductEffectiveDiscount
+from discount.synthetic import generate
+
+
+class Command(BaseCommand):
+    
+    help = ('Measures queries, sql size, time and memory of discount apis, '
+            'on current data or on generated catalogues of given sizes')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='',
+                            help='comma separated amounts of products, e.g. 1000,10000,100000, '
+                                 'every catalogue is generated and rolled back')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--page', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=500,
+                            help='amount of concurrent requests of async case')
+        parser.add_argument('--output', help='json file, stdout by default')
+    
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+        results = []
+        
+        if not sizes:
+            results.extend(benchmark.run(
+                page=options['page'], concurrency=options['concurrency'], products=None))
+        
+        for size in sizes:
+            with transaction.atomic():
+                generate(size, seed=options['seed'])
+                ProductEffectiveDiscount.objects.refresh()
+                CustomerEffectiveDiscount.objects.refresh()
+                results.extend(benchmark.run(
+                    page=options['page'], concurrency=options['concurrency'], products=size))
+                transaction.set_rollback(True)
+            self.stderr.write('{} products done'.format(size))
+        
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+        else:
+            json.dump(results, sys.stdout, indent=2)
+            sys.stdout.write('\n')
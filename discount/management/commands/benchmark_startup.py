@@ -0,0 +1,21 @@
+import json
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from discount import startup
+
+
+class Command(BaseCommand):
+    
+    help = ('Measures cold start of fresh processes: django.setup(), first and second '
+            'discount lookup, median and min of runs are written as json')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+    
+    def handle(self, *args, **options):
+        summary = startup.run(options['runs'], settings.SETTINGS_MODULE)
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write('\n')
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from discount.compaction import compact
+
+
+class Command(BaseCommand):
+    
+    help = ('Archives expired discount campaigns, merges campaigns with the same window '
+            'and deletes dominated discount items, effective discounts do not change')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report what would be changed')
+        parser.add_argument('--keep-days', type=int, default=0,
+                            help='archive campaigns which ended more than given days ago '
+                                 'and before the last run of process_discount_boundaries')
+        parser.add_argument('--no-archive', action='store_true')
+    
+    def handle(self, *args, **options):
+        stats = compact(archive=not options['no_archive'],
+                        archive_before=timezone.now() - timedelta(days=options['keep_days']),
+                        dry_run=options['dry_run'])
+        self.stdout.write('{}archived {archived} campaigns, merged {merged} campaigns, '
+                          'deleted {dominated} dominated items, {overlapping} items '
+                          'overlap items of other campaigns'.format(
+                              'dry run: ' if options['dry_run'] else '', **stats))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from discount.models import Customer, Order, Product
+
+
+class Command(BaseCommand):
+    
+    help = 'Prints query plans of discount querysets'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true',
+                            help='execute queries (postgresql, mysql 8)')
+        parser.add_argument('--limit', type=int, default=100,
+                            help='rows of one page of list')
+    
+    def handle(self, *args, **options):
+        limit = options['limit']
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        
+        querysets = [
+            ('products page', Product.objects.objects_discount(materialized=False).order_by('pk')[:limit]),
+            ('products sorted by discount price', Product.objects.objects_discount(materialized=False).order_by('discount_price')[:limit]),
+            ('product lookup', Product.objects.objects_discount(materialized=False).filter(pk=1)),
+            ('customers page', Customer.objects.objects_discount(materialized=False).order_by('pk')[:limit]),
+            ('orders with totals', Order.objects.with_totals()[:limit]),
+        ]
+        
+        for title, queryset in querysets:
+            self.stdout.write('-- {}'.format(title))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from discount.export import FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    
+    help = 'Exports products with discounts and discount prices as csv or json lines'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', help='file, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--materialized', action='store_true',
+                            help='read materialized discounts')
+    
+    def handle(self, *args, **options):
+        lines = export_lines(options['format'], chunk_size=options['chunk_size'],
+                             materialized=options['materialized'] or None)
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from discount.models import CustomerEffectiveDiscount, ProductEffectiveDiscount
+from discount.synthetic import generate
+
+
+class Command(BaseCommand):
+    
+    help = 'Generates reproducible synthetic catalogue with discounts, customers and orders'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        for name in ('brands', 'categories', 'campaigns', 'customers', 'orders', 'order-items'):
+            parser.add_argument('--' + name, type=int,
+                                help='default depends on amount of products')
+    
+    def handle(self, *args, **options):
+        sizes = {
+            name: options[name] for name in (
+                'brands', 'categories', 'campaigns', 'customers', 'orders', 'order_items')
+            if options[name] is not None
+        }
+        result = generate(options['products'], seed=options['seed'], **sizes)
+        ProductEffectiveDiscount.objects.refresh()
+        CustomerEffectiveDiscount.objects.refresh()
+        self.stdout.write(', '.join('{} {}'.format(value, name) for name, value in result.items()))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from discount.scheduler import next_boundary, process_boundaries
+
+
+class Command(BaseCommand):
+    
+    help = ('Recomputes materialized discounts of discounts which became '
+            'active or expired since previous run, it is run from cron')
+    
+    def handle(self, *args, **options):
+        result = process_boundaries()
+        self.stdout.write(
+            'processed {boundaries} boundaries from {since} to {until}, '
+            'recomputed {products} products, {customers} customers'.format(**result))
+        self.stdout.write('next boundary: {}'.format(next_boundary(result['until'])))
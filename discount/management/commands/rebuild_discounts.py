@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from discount.cache import bump_generation_on_commit
+from discount.models import (
+    Customer, Product, CustomerEffectiveDiscount, ProductEffectiveDiscount)
+
+
+PRODUCT_FIELDS = ['product_discount', 'brand_discount', 'category_discount', 'exclusive',
+                  'max_discount', 'discount_price']
+CUSTOMER_FIELDS = ['max_discount']
+
+
+class Command(BaseCommand):
+    
+    help = 'Rebuilds materialized discounts of products and customers'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='compare materialized discounts with live computation')
+        parser.add_argument('--verify-only', action='store_true',
+                            help='only compare, do not rebuild')
+    
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            products = ProductEffectiveDiscount.objects.refresh()
+            customers = CustomerEffectiveDiscount.objects.refresh()
+            bump_generation_on_commit()
+            self.stdout.write('rebuilt {} products, {} customers'.format(
+                products, customers))
+        
+        if options['verify'] or options['verify_only']:
+            errors = self.verify(Product, PRODUCT_FIELDS)
+            errors += self.verify(Customer, CUSTOMER_FIELDS)
+            if errors:
+                raise CommandError('{} rows differ from live computation'.format(errors))
+            self.stdout.write('materialized discounts are up to date')
+    
+    def verify(self, model, fields, chunk_size=2000):
+        live = model.objects.objects_discount(materialized=False).order_by('pk')
+        stored = model.objects.objects_discount(materialized=True)
+        errors = 0
+        last_id = 0
+        while True:
+            chunk = list(live.filter(pk__gt=last_id).values('pk', *fields)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1]['pk']
+            stored_rows = {
+                row['pk']: row for row in stored.filter(
+                    pk__in=[row['pk'] for row in chunk],
+                    effective_discount__isnull=False).values('pk', *fields)
+            }
+            for row in chunk:
+                if stored_rows.get(row['pk']) != row:
+                    errors += 1
+                    self.stderr.write('{} {}: live {} stored {}'.format(
+                        model.__name__, row['pk'], row, stored_rows.get(row['pk'])))
+        return errors
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from discount.parallel import PARTITION_KEYS, recompute
+
+
+class Command(BaseCommand):
+    
+    help = ('Recomputes materialized discounts of products by pool of processes, '
+            'products are partitioned by id ranges, brands or categories')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--by', choices=sorted(PARTITION_KEYS), default='id')
+        parser.add_argument('--partitions', type=int,
+                            help='amount of partitions, 4 per worker by default')
+        parser.add_argument('--workers', type=int, help='processes, number of cpus by default, 1 runs without pool')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--state', help='file of finished partitions for --resume')
+        parser.add_argument('--resume', action='store_true',
+                            help='skip partitions finished by previous run with the same --state')
+    
+    def handle(self, *args, **options):
+        if options['resume'] and not options['state']:
+            raise CommandError('--resume needs --state')
+        
+        stats = recompute(by=options['by'], partitions=options['partitions'],
+                          workers=options['workers'], state_path=options['state'],
+                          resume=options['resume'], chunk_size=options['chunk_size'],
+                          progress=self.progress)
+        
+        for name, error in sorted(stats['failed'].items()):
+            self.stderr.write('partition {} failed: {}'.format(name, error))
+        self.stdout.write('recomputed {products} products of {partitions} partitions '
+                          '({skipped} skipped) in {seconds:.2f}s'.format(**stats))
+        if stats['failed']:
+            raise CommandError('{} partitions failed, run again with --resume'.format(
+                len(stats['failed'])))
+    
+    def progress(self, name, count, seconds, done, total):
+        self.stdout.write('[{}/{}] partition {}: {} products in {:.2f}s'.format(
+            done, total, name, count, seconds))
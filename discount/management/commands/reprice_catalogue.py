@@ -0,0 +1,56 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from discount import engine
+from discount.export import FORMATS
+from discount.history import parse_moment
+
+
+class Command(BaseCommand):
+    
+    help = ('Computes discounts and discount prices of whole catalogue by vectorized engine, '
+            'writes them to materialized discounts or exports them')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--write', action='store_true',
+                            help='replace materialized discounts of products')
+        parser.add_argument('--format', choices=sorted(FORMATS),
+                            help='export prices as csv or json lines')
+        parser.add_argument('--output', help='file of export, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=100000)
+        parser.add_argument('--at', type=parse_moment,
+                            help='export prices valid at given time instead of now')
+        parser.add_argument('--no-numpy', action='store_true',
+                            help='use module array even when numpy is installed')
+    
+    def handle(self, *args, **options):
+        use_numpy = False if options['no_numpy'] else None
+        if options['at'] and options['write']:
+            raise CommandError('materialized discounts are discounts of now, --at can not be written')
+        start = time.perf_counter()
+        
+        self.count = 0
+        if options['write']:
+            self.count = engine.write_materialized(options['chunk_size'], use_numpy)
+        elif options['format']:
+            lines = FORMATS[options['format']][0](
+                self.counted(engine.iter_prices(options['chunk_size'], use_numpy, options['at'])),
+                engine.ENGINE_FIELDS)
+            if options['output']:
+                with open(options['output'], 'w', newline='') as output:
+                    output.writelines(lines)
+            else:
+                sys.stdout.writelines(lines)
+        else:
+            self.count = sum(len(columns['id']) for columns in engine.PricingEngine(
+                options['chunk_size'], use_numpy, options['at']).chunks())
+        
+        self.stderr.write('{} products priced in {:.2f}s'.format(
+            self.count, time.perf_counter() - start))
+    
+    def counted(self, rows):
+        for row in rows:
+            self.count += 1
+            yield row
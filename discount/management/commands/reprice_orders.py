@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from discount.repricing import BATCH_SIZE, reprice_orders
+
+
+def id_list(value):
+    return [int(pk) for pk in value.split(',') if pk]
+
+
+class Command(BaseCommand):
+    
+    help = ('Recomputes prices and discounts of items and discounts of unpaid orders '
+            'from current discounts, without options all unpaid orders are repriced')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--discounts', type=id_list,
+                            help='comma separated ids of changed discounts')
+        parser.add_argument('--customers', type=id_list,
+                            help='comma separated ids of customers with changed discounts')
+        parser.add_argument('--products', type=id_list,
+                            help='comma separated ids of changed products')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='orders repriced in one transaction')
+    
+    def handle(self, *args, **options):
+        stats = reprice_orders(discount_ids=options['discounts'],
+                               customer_ids=options['customers'],
+                               product_ids=options['products'],
+                               batch_size=options['batch_size'])
+        self.stdout.write('checked {orders} unpaid orders, changed {changed_orders} orders '
+                          'and {changed_items} items in {seconds:.2f}s'.format(**stats))
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0005_auto_20190204_1710'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerEffectiveDiscount',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='effective_discount', serialize=False, to='discount.customer')),
+                ('max_discount', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductEffectiveDiscount',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='effective_discount', serialize=False, to='discount.product')),
+                ('product_discount', models.IntegerField(default=0)),
+                ('brand_discount', models.IntegerField(default=0)),
+                ('category_discount', models.IntegerField(default=0)),
+                ('max_discount', models.IntegerField(default=0)),
+                ('discount_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0006_effective_discount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscountSchedule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('processed_until', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='customerdiscount',
+            name='valid_from',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='customerdiscount',
+            name='valid_to',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='discount',
+            name='valid_from',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='discount',
+            name='valid_to',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0007_discount_schedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='branddiscountitem',
+            index=models.Index(fields=['brand', 'head', 'discount'], name='discount_br_brand_i_548722_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='categorydiscountitem',
+            index=models.Index(fields=['category', 'head', 'discount'], name='discount_ca_categor_3a07e4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerdiscount',
+            index=models.Index(fields=['customer', 'valid_from', 'valid_to', 'discount'], name='discount_cu_custome_91eb8a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productdiscountitem',
+            index=models.Index(fields=['product', 'head', 'discount'], name='discount_pr_product_ca69a5_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0008_discount_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='producteffectivediscount',
+            name='discount_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='producteffectivediscount',
+            name='max_discount',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0009_effective_discount_price_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discount',
+            name='exclusive',
+            field=models.BooleanField(default=False, help_text='discounts of exclusive campaign are not stacked with other discounts'),
+        ),
+        migrations.AddField(
+            model_name='producteffectivediscount',
+            name='exclusive',
+            field=models.BooleanField(default=False),
+        ),
+    ]
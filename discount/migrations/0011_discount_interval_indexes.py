@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0010_exclusive_discounts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customerdiscount',
+            index=models.Index(fields=['customer', 'valid_to', 'valid_from', 'discount'], name='discount_cu_custome_186831_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discount',
+            index=models.Index(fields=['valid_to', 'valid_from'], name='discount_di_valid_t_c750cc_idx'),
+        ),
+    ]
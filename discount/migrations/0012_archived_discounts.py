@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0011_discount_interval_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedDiscount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('discount_id', models.IntegerField(unique=True)),
+                ('valid_from', models.DateTimeField()),
+                ('valid_to', models.DateTimeField()),
+                ('exclusive', models.BooleanField(default=False)),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedDiscountItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('product', 'product'), ('brand', 'brand'), ('category', 'category')], max_length=10)),
+                ('target_id', models.IntegerField()),
+                ('discount', models.IntegerField()),
+                ('head', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='discount.archiveddiscount')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archiveddiscount',
+            index=models.Index(fields=['valid_to', 'valid_from'], name='discount_ar_valid_t_2c865e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archiveddiscountitem',
+            index=models.Index(fields=['level', 'target_id', 'head'], name='discount_ar_level_f465e9_idx'),
+        ),
+    ]
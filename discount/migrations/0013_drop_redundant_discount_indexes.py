@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0012_archived_discounts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customerdiscount',
+            name='discount_cu_custome_91eb8a_idx',
+        ),
+        migrations.AlterField(
+            model_name='customerdiscount',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='discount.customer'),
+        ),
+        migrations.AlterField(
+            model_name='discount',
+            name='valid_to',
+            field=models.DateTimeField(),
+        ),
+    ]
@@ -1,42 +1,179 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Case, When, IntegerField
-from decimal import Decimal
+from django.db.models import BooleanField, ExpressionWrapper, F, OuterRef, Q, Value
+from django.db.models.functions import Coalesce
+from collections.abc import Iterable
+from decimal import ROUND_HALF_UP, Decimal
+from discount.instrumentation import instrument
+from discount.expressions import (
+    archived_discount_items, current_customer_discounts, current_discount_items,
+    discount_price, max_discount_subquery, max_of, max_rank_subquery, percent_of,
+    sum_subquery)
+from discount.rows import (
+    CustomerRowIterable, ProductRowIterable, as_rows, rows_by_id)
+from discount.rules import (
+    EXCLUSIVE_RANK, customer_stacked, item_discount, level_discount,
+    order_discount, stacked_expression)
 
 
-class CustomerManager(models.Manager):
+def use_materialized(materialized=None):
+    '''
+    materialized discounts are read when it is set by argument or
+    by setting DISCOUNT_MATERIALIZED
+    '''
+    if materialized is None:
+        return getattr(settings, 'DISCOUNT_MATERIALIZED', False)
+    return materialized
+
+
+def id_batch(ids):
+    '''
+    tuple (many, list of ids), any iterable except string is batch of ids
+    (list, set, generator, range, dict keys, values_list queryset),
+    anything else is one id
+    '''
+    if isinstance(ids, (str, bytes)) or not isinstance(ids, Iterable):
+        return False, [ids]
+    return True, list(ids)
+
+
+class DiscountManager(models.Manager):
+    
+    '''
+    common api of managers with discounts, objects_discount and row_iterable
+    are implemented by subclasses
+    '''
+    
+    row_iterable = None
+    
+    def fetch_discounts(self, ids, at=None):
+        '''
+        objects without materialized discounts (created by bulk_create
+        or raw sql before rebuild_discounts) are computed live, sql of
+        current discounts is compiled once, see discount.compiled
+        '''
+        if at is not None:
+            return self.objects_discount(at=at).in_bulk(ids)
+        
+        from discount import compiled
+        
+        materialized = use_materialized()
+        objects = compiled.fetch(self, ids, materialized)
+        if materialized and len(objects) < len(ids):
+            missing = [pk for pk in ids if pk not in objects]
+            objects.update(compiled.fetch(self, missing, False))
+        return objects
+    
+    def rows(self, materialized=None, at=None):
+        '''
+        objects_discount as queryset of read-only rows of discount.rows,
+        it can be filtered, ordered and sliced as objects_discount
+        '''
+        return as_rows(self.objects_discount(materialized, at), self.row_iterable)
+    
+    def discount_rows(self, ids, at=None):
+        '''
+        dict {id: row} of given ids, fast path of discount_for for consumers
+        which need discount figures only, cache of discount_for is not used
+        '''
+        ids = list(ids)
+        if at is not None:
+            return rows_by_id(self.rows(at=at), ids)
+        rows = rows_by_id(self.rows(), ids)
+        if use_materialized() and len(rows) < len(ids):
+            missing = [pk for pk in ids if pk not in rows]
+            rows.update(rows_by_id(self.rows(materialized=False), missing))
+        return rows
+    
+    def discount_for(self, ids, at=None):
+        '''
+        gets discounts only for given id or iterable of ids by one query,
+        returns object with discount fields (or None) for one id
+        and dict {id: object} for iterable of ids (see id_batch),
+        objects are taken from discount.cache when it is enabled,
+        with at discounts valid at given time are computed without cache
+        '''
+        from discount.cache import get_discount_cache
+        
+        many, id_list = id_batch(ids)
+        
+        with instrument('{}.discount_for'.format(self.model.__name__), self.db) as stats:
+            discount_cache = get_discount_cache() if at is None else None
+            if discount_cache is None:
+                objects = self.fetch_discounts(id_list, at)
+            else:
+                objects, missing, generation = discount_cache.get_many(self.model, id_list)
+                stats['cache_hits'] = len(objects)
+                stats['cache_misses'] = len(missing)
+                if missing:
+                    fetched = self.fetch_discounts(missing)
+                    discount_cache.set_many(self.model, fetched, generation)
+                    objects.update(fetched)
+            stats['rows_returned'] = len(objects)
+        
+        if many:
+            return objects
+        return objects.get(ids)
+    
+    def timeline(self, ids, since, until):
+        '''
+        discounts of given ids changing between since and until,
+        see discount.history
+        '''
+        from discount import history
+        
+        return history.TIMELINES[self.model._meta.model_name](ids, since, until, using=self.db)
+
+    async def afetch_discounts(self, ids):
+        '''
+        one thread switch for cache, query and fallback of materialized
+        discounts, the async ORM of django runs queries in the same way
+        '''
+        return await sync_to_async(self.discount_for)(list(ids))
+    
+    async def adiscount_for(self, ids):
+        '''
+        async discount_for, lookups of concurrent coroutines are coalesced
+        by discount.batching into one query
+        '''
+        from discount.batching import get_loader
+        
+        if isinstance(ids, models.QuerySet):
+            ids = [pk async for pk in ids]
+        many, id_list = id_batch(ids)
+        objects = await get_loader(self).load_many(id_list)
+        
+        if many:
+            return objects
+        return objects.get(ids)
+
+
+class CustomerManager(DiscountManager):
     
     '''
     queryset contains field max_discount, we can use it for getting discount,
-    when creating order and showing discount in list, make sorting and filtering
+    when creating order and showing discount in list, make sorting and filtering,
+    with materialized=True it is read from CustomerEffectiveDiscount by inner join,
+    with at it is discount valid at given time, always computed live
     '''
+    
+    row_iterable = CustomerRowIterable
         
-    def objects_discount(self):
-        objects_raw = self.raw('''
-                WITH current_discount_customer AS (
-                SELECT id
-                FROM discount_customerdiscount
-                where valid_from<=datetime('now') and valid_to>=datetime('now')
-                )
-                select c.id as id, c.name as name,
-                IFNULL(cd.discount,0) as max_discount
-                from discount_customer as c
-                left join (
-                    select customer_id, max(discount) as discount from discount_customerdiscount
-                    where id in current_discount_customer group by customer_id
-                    ) as cd on c.id = cd.customer_id;
-                ''')
-         
-        max_discount_when = [When(id=row.id, then=row.max_discount) for row in objects_raw]
+    def objects_discount(self, materialized=None, at=None):
         
         queryset = super(CustomerManager, self).get_queryset()
         
-        queryset = queryset.annotate(
-            max_discount=Case(
-                *max_discount_when,
-                default=0,
-                output_field=IntegerField()
+        if at is None and use_materialized(materialized):
+            return queryset.filter(effective_discount__isnull=False).annotate(
+                max_discount=F('effective_discount__max_discount')
             )
+        
+        current_discount = current_customer_discounts(CustomerDiscount, at)
+        
+        queryset = queryset.annotate(
+            max_discount=max_discount_subquery(current_discount, 'customer', 'pk')
         )
         
         return queryset
@@ -52,12 +189,21 @@ class Customer(models.Model):
 
    
 class CustomerDiscount(models.Model):
-    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, db_index=True)
-    valid_from = models.DateTimeField()
-    valid_to = models.DateTimeField()
+    # customer is the first column of interval index, single valid_from
+    # and valid_to are range scans of discount.scheduler
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, db_index=False)
+    valid_from = models.DateTimeField(db_index=True)
+    valid_to = models.DateTimeField(db_index=True)
     discount = models.IntegerField(validators=[MinValueValidator(0),
                                                MaxValueValidator(100)])
     
+    class Meta:
+        # current discounts and windows overlapping [since, until] have
+        # valid_to >= since, expired discounts are skipped
+        indexes = [
+            models.Index(fields=['customer', 'valid_to', 'valid_from', 'discount']),
+        ]
+    
     def __str__(self):
         return '{} discount from {} to {}'.format(
             self.customer.__str__(), self.valid_from, self.valid_to)
@@ -77,86 +223,87 @@ class Brand(models.Model):
         return self.name
 
 
-class ProductManager(models.Manager):
+def level_rank(level, model, field, outer_field, at=None):
+    '''
+    rank of level of product now or at given time, with at items of campaigns
+    moved to archive by discount.compaction are ranked too
+    '''
+    rank = max_rank_subquery(current_discount_items(model, at), field, outer_field,
+                             EXCLUSIVE_RANK)
+    if at is None:
+        return rank
+    return max_of(rank, max_rank_subquery(
+        archived_discount_items(ArchivedDiscountItem, level, at), 'target_id', outer_field,
+        EXCLUSIVE_RANK))
+
+
+class ProductManager(DiscountManager):
     
     '''
-    queryset contains fields product_discount, brand_discount, category_discount, max_discount, discount_price we can use them for getting discounts,
-    when creating order and showing discounts in list, make sorting and filtering
+    queryset contains fields product_discount, brand_discount, category_discount, exclusive, max_discount, discount_price we can use them for getting discounts,
+    max_discount is stacked discount of levels by policy of discount.rules,
+    when creating order and showing discounts in list, make sorting and filtering,
+    with materialized=True they are read from ProductEffectiveDiscount by inner join,
+    so sorting can use its indexes, with at they are discounts valid at given
+    time, always computed live
     '''
+    
+    row_iterable = ProductRowIterable
         
-    def objects_discount(self):
-        objects_raw = self.raw('''
-                WITH current_discount AS (
-                SELECT id
-                FROM discount_discount
-                where valid_from<=datetime('now') and valid_to>=datetime('now')
-                )
-                select dp.id as id,
-                IFNULL(dpi.discount,0) as product_discount, 
-                IFNULL(dbi.discount,0) as brand_discount, 
-                IFNULL(dci.discount,0) as category_discount,
-                max(IFNULL(dpi.discount,0), IFNULL(dbi.discount,0), IFNULL(dci.discount,0)) as max_discount,
-                IFNULL(dp.price,0)-(IFNULL(dp.price,0)*max(IFNULL(dpi.discount,0), IFNULL(dbi.discount,0), IFNULL(dci.discount,0))/100) as discount_price
-                from discount_product as dp
-                left join (
-                    select product_id, max(discount) as discount from discount_productdiscountitem
-                    where head_id in current_discount group by product_id
-                    ) as dpi on dp.id = dpi.product_id
-                left join (
-                    select brand_id, max(discount) as discount from discount_branddiscountitem
-                    where head_id in current_discount group by brand_id
-                    ) as dbi on dp.brand_id = dbi.brand_id
-                left join (
-                    select category_id, max(discount) as discount from discount_categorydiscountitem
-                    where head_id in current_discount group by category_id
-                    ) as dci on dp.category_id = dci.category_id;
-                ''')
-        
-        product_discount_when=[]
-        brand_discount_when=[]
-        category_discount_when=[]
-        max_discount_when=[]
-        discount_price_when=[]
-        
-        for row in objects_raw:
-            product_discount_when.append(When(id=row.id, then=row.product_discount))
-            brand_discount_when.append(When(id=row.id, then=row.brand_discount))
-            category_discount_when.append(When(id=row.id, then=row.category_discount))
-            max_discount_when.append(When(id=row.id, then=row.max_discount))
-            discount_price_when.append(When(id=row.id, then=row.discount_price))
+    def objects_discount(self, materialized=None, at=None):
         
         queryset = super(ProductManager, self).get_queryset()
         
-        queryset = queryset.annotate(
-            product_discount=Case(
-                *product_discount_when,
-                default=0,
-                output_field=IntegerField()
-            ),
-            brand_discount=Case(
-                *brand_discount_when,
-                default=0,
-                output_field=IntegerField()
-            ),
-            category_discount=Case(
-                *category_discount_when,
-                default=0,
-                output_field=IntegerField()
-            ),
-            max_discount=Case(
-                *max_discount_when,
-                default=0,
-                output_field=IntegerField()
-            ),
-            discount_price=Case(
-                *discount_price_when,
-                default=0,
-                output_field=IntegerField()
+        if at is None and use_materialized(materialized):
+            return queryset.filter(effective_discount__isnull=False).annotate(
+                product_discount=F('effective_discount__product_discount'),
+                brand_discount=F('effective_discount__brand_discount'),
+                category_discount=F('effective_discount__category_discount'),
+                exclusive=F('effective_discount__exclusive'),
+                max_discount=F('effective_discount__max_discount'),
+                discount_price=F('effective_discount__discount_price')
             )
+        
+        # rank of level is its max discount, increased by EXCLUSIVE_RANK
+        # when it is discount of exclusive campaign, see discount.rules;
+        # aliases are inlined, every reference is evaluated again
+        queryset = queryset.alias(
+            product_rank=level_rank('product', ProductDiscountItem, 'product', 'pk', at),
+            brand_rank=level_rank('brand', BrandDiscountItem, 'brand', 'brand_id', at),
+            category_rank=level_rank('category', CategoryDiscountItem, 'category', 'category_id',
+                                     at),
+        ).alias(
+            discount_rank=max_of('product_rank', 'brand_rank', 'category_rank')
+        ).annotate(
+            product_discount=level_discount('product_rank'),
+            brand_discount=level_discount('brand_rank'),
+            category_discount=level_discount('category_rank'),
+            exclusive=ExpressionWrapper(Q(discount_rank__gte=EXCLUSIVE_RANK),
+                                        output_field=BooleanField()),
+        ).annotate(
+            max_discount=stacked_expression({
+                'product': F('product_discount'),
+                'brand': F('brand_discount'),
+                'category': F('category_discount'),
+            }, rank=F('discount_rank'))
+        ).annotate(
+            discount_price=discount_price(F('price'), F('max_discount'))
         )
         
         return queryset
     
+    def affected_by_discounts(self, discount_ids):
+        '''
+        products with items of given discounts on product, brand or category
+        '''
+        return self.filter(
+            Q(pk__in=ProductDiscountItem.objects.filter(
+                head_id__in=discount_ids).values('product_id')) |
+            Q(brand_id__in=BrandDiscountItem.objects.filter(
+                head_id__in=discount_ids).values('brand_id')) |
+            Q(category_id__in=CategoryDiscountItem.objects.filter(
+                head_id__in=discount_ids).values('category_id')))
+    
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
@@ -172,8 +319,18 @@ class Product(models.Model):
   
 class Discount(models.Model):
     
-    valid_from = models.DateTimeField()
+    # valid_to is the first column of interval index
+    valid_from = models.DateTimeField(db_index=True)
     valid_to = models.DateTimeField()
+    exclusive = models.BooleanField(default=False,
+                                    help_text='discounts of exclusive campaign are not stacked with other discounts')
+    
+    class Meta:
+        # interval index, windows overlapping [since, until] have
+        # valid_to >= since and valid_from <= until, old history is skipped
+        indexes = [
+            models.Index(fields=['valid_to', 'valid_from']),
+        ]
     
     def __str__(self):
         return 'discount from {} to {}'.format(self.valid_from, self.valid_to)
@@ -187,6 +344,11 @@ class ProductDiscountItem(models.Model):
     discount = models.IntegerField(validators=[MinValueValidator(0),
                                                MaxValueValidator(100)])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'head', 'discount']),
+        ]
+
     def __str__(self):
         return '{}'.format(self.product.__str__())
     
@@ -199,6 +361,11 @@ class BrandDiscountItem(models.Model):
     discount = models.IntegerField(validators=[MinValueValidator(0),
                                                MaxValueValidator(100)])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['brand', 'head', 'discount']),
+        ]
+
     def __str__(self):
         return '{}'.format(self.brand.__str__())
     
@@ -211,10 +378,288 @@ class CategoryDiscountItem(models.Model):
     discount = models.IntegerField(validators=[MinValueValidator(0),
                                                MaxValueValidator(100)])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'head', 'discount']),
+        ]
+
     def __str__(self):
         return '{}'.format(self.category.__str__())
 
 
+DISCOUNT_ITEMS = (
+    ('product', ProductDiscountItem, 'product_id'),
+    ('brand', BrandDiscountItem, 'brand_id'),
+    ('category', CategoryDiscountItem, 'category_id'),
+)
+
+
+class EffectiveDiscountManager(models.Manager):
+    
+    '''
+    refresh recomputes materialized discounts of given ids (all rows when ids
+    is None), ids can be list or queryset of ids of related model; rows
+    are computed and written in database of manager (see db_manager)
+    '''
+    
+    chunk_size = 2000
+    
+    def refresh(self, ids=None):
+        related = self.model._meta.pk.remote_field.model
+        queryset = related.objects.db_manager(self.db).objects_discount(
+            materialized=False).order_by('pk')
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids)
+        
+        count = 0
+        last_id = 0
+        with transaction.atomic(using=self.db):
+            while True:
+                chunk = list(queryset.filter(pk__gt=last_id)[:self.chunk_size])
+                if not chunk:
+                    break
+                last_id = chunk[-1].pk
+                rows = [self.model.from_object(obj) for obj in chunk]
+                self.filter(pk__in=[obj.pk for obj in chunk]).delete()
+                self.bulk_create(rows)
+                count += len(rows)
+            
+            if ids is None:
+                self.exclude(pk__in=related.objects.values('pk')).delete()
+        
+        return count
+    
+    
+class CustomerEffectiveDiscount(models.Model):
+    
+    '''
+    materialized discount of customer, it is kept up to date by signals
+    and rebuilt by command rebuild_discounts
+    '''
+    
+    customer = models.OneToOneField(Customer, related_name='effective_discount',
+                                    on_delete=models.CASCADE, primary_key=True)
+    max_discount = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+    
+    objects = EffectiveDiscountManager()
+    
+    def __str__(self):
+        return '{} discount {}'.format(self.customer_id, self.max_discount)
+    
+    @classmethod
+    def from_object(cls, obj):
+        return cls(customer_id=obj.pk, max_discount=obj.max_discount)
+    
+
+class ProductEffectiveDiscountManager(EffectiveDiscountManager):
+    
+    def refresh_related(self, product_ids=None, brand_ids=None, category_ids=None):
+        '''
+        recomputes products with given ids, brands or categories,
+        arguments can be lists or querysets of ids
+        '''
+        query = Q()
+        if product_ids is not None:
+            query |= Q(pk__in=product_ids)
+        if brand_ids is not None:
+            query |= Q(brand_id__in=brand_ids)
+        if category_ids is not None:
+            query |= Q(category_id__in=category_ids)
+        if not query:
+            return 0
+        return self.refresh(Product.objects.filter(query).values('pk'))
+    
+    def refresh_discounts(self, discount_ids):
+        '''
+        recomputes products which are affected by items of given discounts
+        '''
+        return self.refresh(Product.objects.affected_by_discounts(discount_ids).values('pk'))
+
+
+class ProductEffectiveDiscount(models.Model):
+    
+    '''
+    materialized discounts of product, they are kept up to date by signals
+    and rebuilt by command rebuild_discounts
+    '''
+    
+    product = models.OneToOneField(Product, related_name='effective_discount',
+                                   on_delete=models.CASCADE, primary_key=True)
+    product_discount = models.IntegerField(default=0)
+    brand_discount = models.IntegerField(default=0)
+    category_discount = models.IntegerField(default=0)
+    exclusive = models.BooleanField(default=False)
+    max_discount = models.IntegerField(default=0, db_index=True)
+    discount_price = models.DecimalField(decimal_places=2, max_digits=10, db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+    
+    objects = ProductEffectiveDiscountManager()
+    
+    def __str__(self):
+        return '{} discount {}'.format(self.product_id, self.max_discount)
+    
+    @classmethod
+    def from_object(cls, obj):
+        return cls(product_id=obj.pk,
+                   product_discount=obj.product_discount,
+                   brand_discount=obj.brand_discount,
+                   category_discount=obj.category_discount,
+                   exclusive=obj.exclusive,
+                   max_discount=obj.max_discount,
+                   discount_price=obj.discount_price)
+
+
+class DiscountSchedule(models.Model):
+    
+    '''
+    time until which validity boundaries of discounts were processed
+    by scheduler, see discount.scheduler
+    '''
+    
+    name = models.CharField(max_length=50, unique=True)
+    processed_until = models.DateTimeField()
+    
+    def __str__(self):
+        return '{} processed until {}'.format(self.name, self.processed_until)
+
+
+class ArchivedDiscount(models.Model):
+    
+    '''
+    expired campaign moved out of Discount by discount.compaction,
+    discounts of now never read it, discounts at given time and history do
+    '''
+    
+    discount_id = models.IntegerField(unique=True)
+    valid_from = models.DateTimeField()
+    valid_to = models.DateTimeField()
+    exclusive = models.BooleanField(default=False)
+    archived = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['valid_to', 'valid_from']),
+        ]
+    
+    def __str__(self):
+        return 'archived discount {} from {} to {}'.format(
+            self.discount_id, self.valid_from, self.valid_to)
+
+
+class ArchivedDiscountItem(models.Model):
+    
+    '''
+    item of archived campaign, target is id of product, brand or category,
+    it is not foreign key, so archive does not protect them from deleting
+    '''
+    
+    LEVELS = (
+        ('product', 'product'),
+        ('brand', 'brand'),
+        ('category', 'category'),
+    )
+    
+    head = models.ForeignKey(ArchivedDiscount, related_name='items', on_delete=models.CASCADE)
+    level = models.CharField(max_length=10, choices=LEVELS)
+    target_id = models.IntegerField()
+    discount = models.IntegerField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['level', 'target_id', 'head']),
+        ]
+    
+    def __str__(self):
+        return '{} {} discount {}'.format(self.level, self.target_id, self.discount)
+
+
+class OrderManager(models.Manager):
+    
+    def with_totals(self):
+        '''
+        queryset contains fields items_gross (sum of price * quantity),
+        items_cost (sum with discounts of items) and total (items_cost with
+        discount of order), they are computed by aggregated subqueries of items
+        '''
+        items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        
+        gross = F('price') * F('quantity')
+        cost = gross - percent_of(gross, F('discount'))
+        
+        queryset = super(OrderManager, self).get_queryset()
+        
+        return queryset.annotate(
+            items_gross=Coalesce(sum_subquery(items, gross), Value(Decimal('0'))),
+            items_cost=Coalesce(sum_subquery(items, cost), Value(Decimal('0'))),
+        ).annotate(
+            total=discount_price(F('items_cost'), F('discount'))
+        )
+    
+    def create_with_items(self, customer, items):
+        '''
+        creates order with items [(product_id, quantity), ...] in one
+        transaction, prices and discounts of all products are got by one query
+        and items are inserted by bulk_create
+        '''
+        return self.save_with_items(customer, self.price_items(customer, items))
+    
+    async def acreate_with_items(self, customer, items):
+        '''
+        async create_with_items, prices and discounts are got by
+        Product.objects.adiscount_for, so they are coalesced with concurrent
+        lookups, order is saved in one transaction in thread
+        '''
+        items = list(items)
+        products = await Product.objects.db_manager(self.db).adiscount_for(
+            {product_id for product_id, quantity in items})
+        cust = None
+        if customer_stacked():
+            cust = await Customer.objects.db_manager(self.db).adiscount_for(customer.pk)
+        
+        order_items = self.build_items(products, cust, items)
+        return await sync_to_async(self.save_with_items)(customer, order_items)
+    
+    def price_items(self, customer, items):
+        '''
+        unsaved order items of cart [(product_id, quantity), ...] with prices
+        and stacked discounts, cart of any size and any policy of
+        discount.rules is priced by one query of products (batches of
+        max_query_params on sqlite, see discount.compiled) and one query
+        of customer when its discount is stacked into items
+        '''
+        items = list(items)
+        products = Product.objects.db_manager(self.db).discount_for(
+            {product_id for product_id, quantity in items})
+        cust = None
+        if customer_stacked():
+            cust = Customer.objects.db_manager(self.db).discount_for(customer.pk)
+        
+        return self.build_items(products, cust, items)
+    
+    def build_items(self, products, cust, items):
+        order_items = []
+        for product_id, quantity in items:
+            prod = products.get(product_id)
+            if prod is None:
+                raise Product.DoesNotExist(
+                    'Product {} does not exist'.format(product_id))
+            order_items.append(OrderItem(product_id=product_id, quantity=quantity,
+                                         price=prod.price,
+                                         discount=item_discount(prod, cust)))
+        return order_items
+    
+    def save_with_items(self, customer, order_items):
+        with instrument('Order.create_with_items', self.db), \
+                transaction.atomic(using=self.db):
+            order = self.model(customer=customer)
+            order.save(using=self.db)
+            for item in order_items:
+                item.order = order
+            OrderItem.objects.db_manager(self.db).bulk_create(order_items)
+        return order
+
+
 class Order(models.Model):
     
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT, db_index=True)
@@ -226,6 +671,8 @@ class Order(models.Model):
                                    validators=[MinValueValidator(0),
                                                MaxValueValidator(100)])
 
+    objects = OrderManager()
+    
     class Meta:
         ordering = ('-created',)
 
@@ -233,18 +680,60 @@ class Order(models.Model):
         return 'Order {}'.format(self.id)
 
     def total_cost(self):
+        if hasattr(self, 'total'):
+            return self.total
+        # rounded half up to cents as total of with_totals by ROUND(..., 2)
         total_cost = sum(item.get_cost() for item in self.items.all())
-        return total_cost - total_cost * (self.discount / Decimal('100'))
+        total_cost = total_cost - total_cost * (self.discount / Decimal('100'))
+        return total_cost.quantize(Decimal('0.01'), ROUND_HALF_UP)
     
     def save(self, force_insert=False, force_update=False, using=None, 
         update_fields=None):
         
-        cust = Customer.objects.objects_discount().filter(id=self.customer.id)
-        if cust:
-            self.discount = cust[0].max_discount
+        with instrument('Order.save', using or 'default'):
+            cust = Customer.objects.discount_for(self.customer_id)
+            self.discount = order_discount(cust)
+            
+            return models.Model.save(self, force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+    
+
+class OrderItemManager(models.Manager):
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        '''
+        bulk_create does not call save, prices and discounts of items
+        without price are stamped here by one query for all products
+        '''
+        objs = list(objs)
+        unpriced = [obj for obj in objs if obj.price is None]
+        if unpriced:
+            products = Product.objects.db_manager(self.db).discount_for(
+                {obj.product_id for obj in unpriced})
+            customers = self.order_customers({obj.order_id for obj in unpriced})
+            for obj in unpriced:
+                prod = products.get(obj.product_id)
+                if prod is None:
+                    raise Product.DoesNotExist(
+                        'Product {} does not exist'.format(obj.product_id))
+                obj.price = prod.price
+                obj.discount = item_discount(prod, customers.get(obj.order_id))
         
-        return models.Model.save(self, force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+        return super(OrderItemManager, self).bulk_create(objs, *args, **kwargs)
     
+    def order_customers(self, order_ids):
+        '''
+        dict {order_id: customer with discount} when discount of customer
+        is stacked into items, otherwise empty dict
+        '''
+        if not customer_stacked():
+            return {}
+        order_customers = dict(Order.objects.db_manager(self.db).filter(
+            pk__in=order_ids).values_list('pk', 'customer_id'))
+        customers = Customer.objects.db_manager(self.db).discount_for(
+            set(order_customers.values()))
+        return {order_id: customers.get(customer_id)
+                for order_id, customer_id in order_customers.items()}
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -254,6 +743,8 @@ class OrderItem(models.Model):
     discount = models.IntegerField(default=0,
                                    validators=[MinValueValidator(0),
                                                MaxValueValidator(100)])
+    
+    objects = OrderItemManager()
 
     def __str__(self):
         return '{}'.format(self.id)
@@ -265,9 +756,13 @@ class OrderItem(models.Model):
     def save(self, force_insert=False, force_update=False, using=None, 
         update_fields=None):
         
-        prod = Product.objects.objects_discount().filter(id=self.product.id)
-        if prod:
-            self.discount = prod[0].max_discount
-            self.price = prod[0].price
-        
-        return models.Model.save(self, force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)  
+        with instrument('OrderItem.save', using or 'default'):
+            prod = Product.objects.discount_for(self.product_id)
+            if prod:
+                cust = None
+                if customer_stacked():
+                    cust = Customer.objects.discount_for(self.order.customer_id)
+                self.discount = item_discount(prod, cust)
+                self.price = prod.price
+            
+            return models.Model.save(self, force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)  
@@ -0,0 +1,109 @@
+'''
+paginator of admin lists with discounts, count of unfiltered list is taken
+from table of model without discounts (of materialized discounts when list
+reads them) or from planner estimate of backend when table is bigger than
+DISCOUNT_ESTIMATED_COUNT_THRESHOLD, discounts are computed only for rows
+of current page
+'''
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models.sql.constants import INNER
+from django.utils.functional import cached_property
+
+
+def estimated_count(model, using='default'):
+    '''
+    amount of rows estimated by statistics of backend, None when
+    there are no statistics
+    '''
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table]),
+        'mysql': ('SELECT table_rows FROM information_schema.tables '
+                  'WHERE table_schema = DATABASE() AND table_name = %s', [table]),
+        'sqlite': ('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table]),
+    }
+    if connection.vendor not in queries:
+        return None
+    if connection.vendor == 'sqlite' and 'sqlite_stat1' not in connection.introspection.table_names():
+        return None
+
+    sql, params = queries[connection.vendor]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    if connection.vendor == 'sqlite':
+        return int(row[0].split()[0])
+    count = int(row[0])
+    return count if count >= 0 else None
+
+
+def counted_model(queryset):
+    '''
+    materialized discounts are read by inner join (see objects_discount),
+    rows without them are not listed, so their table is counted
+    '''
+    model = queryset.model
+    try:
+        related = model._meta.get_field('effective_discount').related_model
+    except FieldDoesNotExist:
+        return model
+    for join in queryset.query.alias_map.values():
+        if join.table_name == related._meta.db_table and getattr(join, 'join_type', None) == INNER:
+            return related
+    return model
+
+
+class DiscountPaginator(Paginator):
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, unfiltered=False):
+        super(DiscountPaginator, self).__init__(
+            object_list, per_page, orphans, allow_empty_first_page)
+        self.unfiltered = unfiltered
+
+    @cached_property
+    def count(self):
+        if not self.unfiltered:
+            return self.object_list.count()
+
+        model = counted_model(self.object_list)
+        using = self.object_list.db
+        threshold = getattr(settings, 'DISCOUNT_ESTIMATED_COUNT_THRESHOLD', 100000)
+        estimate = estimated_count(model, using)
+        if estimate is not None and estimate >= threshold:
+            return estimate
+        return model._default_manager.db_manager(using).count()
+
+    def orders_by_annotation(self):
+        query = self.object_list.query
+        return any(
+            isinstance(field, str) and field.lstrip('-') in query.annotations
+            for field in query.order_by
+        )
+
+    def page(self, number):
+        '''
+        ids of page are selected without discounts, then queryset of page is
+        filtered by these ids, so discounts are computed only for them,
+        unless list is sorted by discount
+        '''
+        number = self.validate_number(number)
+        if self.orders_by_annotation():
+            return super(DiscountPaginator, self).page(number)
+
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        ids = list(self.object_list.values_list('pk', flat=True)[bottom:top])
+        return self._get_page(self.object_list.filter(pk__in=ids), number, self)
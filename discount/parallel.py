@@ -0,0 +1,219 @@
+'''
+parallel recomputation of materialized discounts of products, products are
+split into partitions by ranges of id (of equal amount of products) or by
+groups of brands or categories, partitions are recomputed by pool of
+processes, every process has own connections to database
+
+worker computes live discounts of its partition by keyset chunks without
+transaction and then replaces rows of partition in one short transaction,
+so on sqlite (in WAL mode) and postgresql partitions are read concurrently
+and only writes are serialized
+
+with one worker partitions are recomputed one after another in this
+process without pool
+
+with state file every finished partition is recorded, run with resume
+skips partitions which are already done, partitions are stored in state,
+so they do not change between runs
+'''
+
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.db import connections, transaction
+from django.db.models import Count
+
+from discount.cache import bump_generation_on_commit
+from discount.models import Product, ProductEffectiveDiscount
+
+
+PARTITION_KEYS = {
+    'id': 'pk',
+    'brand': 'brand_id',
+    'category': 'category_id',
+}
+
+Partition = namedtuple('Partition', ['name', 'lookups'])
+
+
+def id_partitions(count):
+    '''
+    ranges of id with the same amount of products, the first and the last
+    are open, so products created later belong to some partition
+    '''
+    ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+    total = ids.count()
+    bounds = sorted({ids[total * k // count] for k in range(1, count)} if total else [])
+    partitions = []
+    low = None
+    for high in bounds + [None]:
+        lookups = {}
+        if low is not None:
+            lookups['pk__gte'] = low
+        if high is not None:
+            lookups['pk__lt'] = high
+        partitions.append(Partition('id:{}-{}'.format(low or '', high or ''), lookups))
+        low = high
+    return partitions
+
+
+def group_partitions(field, count):
+    '''
+    groups of brands or categories with similar amounts of products,
+    the biggest groups are assigned first to the smallest partition
+    '''
+    sizes = Product.objects.order_by().values_list(field).annotate(size=Count('pk'))
+    groups = [[] for i in range(count)]
+    loads = [0] * count
+    for key, size in sorted(sizes, key=lambda row: (-row[1], row[0])):
+        index = loads.index(min(loads))
+        groups[index].append(key)
+        loads[index] += size
+    return [
+        Partition('{}:{}'.format(field, i), {field + '__in': sorted(keys)})
+        for i, keys in enumerate(groups) if keys
+    ]
+
+
+def make_partitions(by='id', count=8):
+    if by not in PARTITION_KEYS:
+        raise ValueError('partitions are made by {}'.format(', '.join(sorted(PARTITION_KEYS))))
+    if by == 'id':
+        return id_partitions(count)
+    return group_partitions(PARTITION_KEYS[by], count)
+
+
+def recompute_partition(partition, chunk_size=2000):
+    '''
+    recomputes materialized discounts of products of partition, returns
+    tuple (name, amount of products, seconds)
+    '''
+    started = time.perf_counter()
+    queryset = Product.objects.rows(materialized=False).filter(
+        **partition.lookups).order_by('pk')
+
+    rows = []
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        rows.extend(ProductEffectiveDiscount.from_object(row) for row in chunk)
+
+    with transaction.atomic():
+        ProductEffectiveDiscount.objects.filter(**{
+            'product__' + lookup: value for lookup, value in partition.lookups.items()
+        }).delete()
+        ProductEffectiveDiscount.objects.bulk_create(rows, batch_size=chunk_size)
+
+    return partition.name, len(rows), time.perf_counter() - started
+
+
+def init_worker():
+    '''
+    worker of spawned process sets django up, forked worker must not
+    use connections of parent
+    '''
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def load_state(path):
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def save_state(path, state):
+    if path is None:
+        return
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as state_file:
+        json.dump(state, state_file, indent=1)
+    os.replace(temporary, path)
+
+
+def run_partitions(partitions, workers, chunk_size):
+    '''
+    yields tuples (partition, result of recompute_partition, error) of
+    finished partitions
+    '''
+    if workers == 1:
+        for partition in partitions:
+            try:
+                yield partition, recompute_partition(partition, chunk_size), None
+            except Exception as exc:
+                yield partition, None, exc
+        return
+
+    # forked workers open own connections, parent must not share its ones
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        futures = {executor.submit(recompute_partition, partition, chunk_size): partition
+                   for partition in partitions}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as exc:
+                yield futures[future], None, exc
+
+
+def recompute(by='id', partitions=None, workers=None, state_path=None, resume=False,
+              chunk_size=2000, progress=None):
+    '''
+    recomputes materialized discounts of all products by pool of workers
+    processes (number of cpus by default), progress is called with
+    (name, amount of products, seconds, finished partitions, all partitions)
+    after every partition; returns dict with amounts of partitions, skipped
+    partitions and products, seconds and dict {name: error} of failed
+    partitions, state file is kept when some partition failed; generation
+    of discount cache is bumped when some partition was written
+    '''
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    state = load_state(state_path) if resume else None
+    if state is None or state['by'] != by:
+        state = {
+            'by': by,
+            'partitions': make_partitions(by, partitions or workers * 4),
+            'done': {},
+        }
+        save_state(state_path, state)
+    todo = [Partition(*partition) for partition in state['partitions']
+            if partition[0] not in state['done']]
+    stats = {
+        'partitions': len(state['partitions']),
+        'skipped': len(state['partitions']) - len(todo),
+        'products': 0,
+        'failed': {},
+    }
+
+    for partition, result, error in run_partitions(todo, workers, chunk_size):
+        if error is not None:
+            stats['failed'][partition.name] = repr(error)
+            continue
+        name, count, seconds = result
+        state['done'][name] = {'products': count, 'seconds': round(seconds, 3)}
+        save_state(state_path, state)
+        stats['products'] += count
+        if progress is not None:
+            progress(name, count, seconds, len(state['done']), stats['partitions'])
+
+    if stats['products']:
+        bump_generation_on_commit()
+    if not stats['failed']:
+        ProductEffectiveDiscount.objects.exclude(pk__in=Product.objects.values('pk')).delete()
+        if state_path is not None:
+            os.remove(state_path)
+    stats['seconds'] = time.perf_counter() - started
+    return stats
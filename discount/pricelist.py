@@ -0,0 +1,93 @@
+'''
+price list of customer, discounts of products are combined with discount
+of customer as order of the customer would combine them: item discount of
+discount.rules and then discount of order, prices are rounded half up
+to cents
+
+version of every price list is the discount generation (see discount.cache)
+plus the next validity boundary, until the boundary discounts change only
+by writes which bump the generation; the version is kept in django cache
+by generation, so conditional requests are answered without queries
+of discount tables, they are read only when generation changes or the
+boundary is crossed
+'''
+
+import hashlib
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import caches
+from django.utils import timezone
+
+from discount.cache import cache_settings, get_generation
+from discount.models import Product
+from discount.rules import item_discount, order_discount, stacking_settings
+
+
+STATE_KEY = 'discount:price_list_state'
+
+CENT = Decimal('0.01')
+
+MAX_LIMIT = 1000
+
+
+def price_list_state(now=None):
+    '''
+    dict with generation, next boundary (or None) and modified time
+    of current discounts
+    '''
+    from discount.scheduler import next_boundary
+
+    now = now or timezone.now()
+    cache = caches[cache_settings()['ALIAS']]
+    generation = get_generation()
+    state = cache.get(STATE_KEY)
+    if state is not None and state['generation'] == generation and (
+            state['boundary'] is None or now < state['boundary']):
+        return state
+
+    if state is not None and state['generation'] == generation:
+        modified = state['boundary']
+    else:
+        modified = now
+    boundary = next_boundary(now)
+    state = {'generation': generation, 'boundary': boundary,
+             'modified': modified.replace(microsecond=0)}
+    timeout = None
+    if boundary is not None:
+        timeout = max(int((boundary - now).total_seconds()) + 1, 1)
+    cache.set(STATE_KEY, state, timeout)
+    return state
+
+
+def price_list_etag(state):
+    options = sorted((name, str(value)) for name, value in stacking_settings().items())
+    version = repr((state['generation'], state['boundary'], options))
+    return hashlib.md5(version.encode()).hexdigest()
+
+
+def customer_price(price, discount, order_disc):
+    price = price * (100 - discount) * (100 - order_disc) / Decimal(10000)
+    return price.quantize(CENT, ROUND_HALF_UP)
+
+
+def customer_prices(customer, after=0, limit=100):
+    '''
+    dicts of prices of products with id greater than after, customer
+    has max_discount (see Customer.objects.discount_for)
+    '''
+    order_disc = order_discount(customer)
+    prices = []
+    for row in Product.objects.rows().filter(pk__gt=after).order_by('pk')[:limit]:
+        discount = item_discount(row, customer)
+        prices.append({
+            'id': row.id,
+            'price': row.price,
+            'product_discount': row.product_discount,
+            'brand_discount': row.brand_discount,
+            'category_discount': row.category_discount,
+            'exclusive': row.exclusive,
+            'discount': discount,
+            'order_discount': order_disc,
+            'customer_price': customer_price(row.price, discount, order_disc),
+        })
+    return prices
@@ -0,0 +1,154 @@
+'''
+repricing of unpaid orders after change of discounts, prices and discounts
+of order items and discounts of orders are recomputed from current
+discounts as Order.save and OrderItem.save would set them
+
+orders are processed in batches by keyset over id, every batch in own
+transaction; rows which differ are found by one query and changed by one
+UPDATE with correlated subqueries of objects_discount, so repricing costs
+the same queries for any amount of items; when discount of customer is
+stacked into items (see discount.rules) items are computed in python from
+discount_rows of products and customers and written by one bulk_update
+
+paid orders are never changed
+'''
+
+import time
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from discount.models import Customer, Order, OrderItem, Product, use_materialized
+from discount.rules import customer_stacked, item_discount
+
+
+BATCH_SIZE = 500
+
+
+def current_value(model, field, outer_field):
+    '''
+    subquery of discount field of row of model, rows without materialized
+    discounts are computed live, as DiscountManager.fetch_discounts does
+    '''
+    def subquery(materialized):
+        return Subquery(model.objects.objects_discount(materialized=materialized).filter(
+            pk=OuterRef(outer_field)).values(field)[:1])
+
+    if not use_materialized():
+        return subquery(False)
+    return Coalesce(subquery(True), subquery(False))
+
+
+def unpaid_orders(orders=None, discount_ids=None, customer_ids=None, product_ids=None):
+    '''
+    queryset of unpaid orders touched by change of given discounts,
+    customers or products, all unpaid orders without arguments
+    '''
+    queryset = Order.objects.filter(paid=False)
+    if orders is not None:
+        queryset = queryset.filter(pk__in=orders)
+
+    query = Q()
+    if discount_ids is not None:
+        query |= Q(pk__in=OrderItem.objects.filter(
+            product__in=Product.objects.affected_by_discounts(discount_ids)).values('order_id'))
+    if product_ids is not None:
+        query |= Q(pk__in=OrderItem.objects.filter(product_id__in=product_ids).values('order_id'))
+    if customer_ids is not None:
+        query |= Q(customer_id__in=customer_ids)
+    return queryset.filter(query)
+
+
+def reprice_items_sql(order_ids):
+    '''
+    amount of changed items and ids of their orders, items are changed
+    by set based UPDATE
+    '''
+    price = current_value(Product, 'price', 'product_id')
+    discount = current_value(Product, 'max_discount', 'product_id')
+    stale = list(OrderItem.objects.filter(order_id__in=order_ids).filter(
+        Q(price__isnull=True) | ~Q(price=price) | ~Q(discount=discount),
+    ).values_list('pk', 'order_id'))
+    if stale:
+        OrderItem.objects.filter(pk__in=[pk for pk, order_id in stale]).update(
+            price=price, discount=discount)
+    return len(stale), {order_id for pk, order_id in stale}
+
+
+def reprice_items_python(order_ids):
+    '''
+    amount of changed items and ids of their orders, discount of
+    customer is stacked into items
+    '''
+    items = list(OrderItem.objects.filter(order_id__in=order_ids).only(
+        'pk', 'order_id', 'product_id', 'price', 'discount').annotate(
+        customer_id=F('order__customer_id')))
+    products = Product.objects.discount_rows({item.product_id for item in items})
+    customers = Customer.objects.discount_rows({item.customer_id for item in items})
+
+    stale = []
+    for item in items:
+        prod = products.get(item.product_id)
+        if prod is None:
+            continue
+        discount = item_discount(prod, customers.get(item.customer_id))
+        if (item.price, item.discount) != (prod.price, discount):
+            item.price = prod.price
+            item.discount = discount
+            stale.append(item)
+    if stale:
+        OrderItem.objects.bulk_update(stale, ['price', 'discount'])
+    return len(stale), {item.order_id for item in stale}
+
+
+def reprice_orders_discount(order_ids):
+    '''
+    ids of orders whose discount was changed
+    '''
+    queryset = Order.objects.filter(pk__in=order_ids)
+    if customer_stacked():
+        stale = list(queryset.exclude(discount=0).values_list('pk', flat=True))
+        if stale:
+            Order.objects.filter(pk__in=stale).update(discount=0)
+        return set(stale)
+
+    discount = current_value(Customer, 'max_discount', 'customer_id')
+    stale = list(queryset.exclude(discount=discount).values_list('pk', flat=True))
+    if stale:
+        Order.objects.filter(pk__in=stale).update(discount=discount)
+    return set(stale)
+
+
+def reprice_orders(orders=None, discount_ids=None, customer_ids=None, product_ids=None,
+                   batch_size=BATCH_SIZE):
+    '''
+    reprices unpaid orders (see unpaid_orders), returns dict with amounts
+    of checked orders, changed orders and changed items and seconds
+    '''
+    started = time.perf_counter()
+    queryset = unpaid_orders(orders, discount_ids, customer_ids, product_ids).order_by(
+        'pk').values_list('pk', flat=True)
+    reprice_items = reprice_items_python if customer_stacked() else reprice_items_sql
+    stats = {'orders': 0, 'changed_orders': 0, 'changed_items': 0}
+
+    last_id = 0
+    while True:
+        order_ids = list(queryset.filter(pk__gt=last_id)[:batch_size])
+        if not order_ids:
+            break
+        last_id = order_ids[-1]
+
+        with transaction.atomic():
+            items, changed = reprice_items(order_ids)
+            changed |= reprice_orders_discount(order_ids)
+            if changed:
+                Order.objects.filter(pk__in=changed).update(updated=timezone.now())
+
+        stats['orders'] += len(order_ids)
+        stats['changed_orders'] += len(changed)
+        stats['changed_items'] += items
+
+    stats['seconds'] = time.perf_counter() - started
+    return stats
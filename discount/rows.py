@@ -0,0 +1,76 @@
+'''
+read-only rows of discount results for consumers which need figures only
+(carts, repricing, listings), they are namedtuples read by values_list, so
+no model instances with __dict__ and model state are built and related
+objects are never loaded; row takes about half of memory of instance
+
+rows have the same attribute names as objects of objects_discount and pk,
+so they can be passed to discount.rules
+'''
+
+from collections import namedtuple
+
+from django.db import connections
+from django.db.models.query import ValuesListIterable
+
+
+class ProductRow(namedtuple('ProductRow', [
+        'id', 'price', 'product_discount', 'brand_discount', 'category_discount',
+        'exclusive', 'max_discount', 'discount_price'])):
+
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class CustomerRow(namedtuple('CustomerRow', ['id', 'max_discount'])):
+
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class RowIterable(ValuesListIterable):
+
+    '''
+    iterable of values_list queryset which yields rows of row_class
+    '''
+
+    row_class = None
+
+    def __iter__(self):
+        return map(self.row_class._make, super(RowIterable, self).__iter__())
+
+
+class ProductRowIterable(RowIterable):
+    row_class = ProductRow
+
+
+class CustomerRowIterable(RowIterable):
+    row_class = CustomerRow
+
+
+def as_rows(queryset, iterable_class):
+    '''
+    values_list queryset of objects_discount yielding rows of iterable_class
+    '''
+    queryset = queryset.values_list(*iterable_class.row_class._fields)
+    queryset._iterable_class = iterable_class
+    return queryset
+
+
+def rows_by_id(queryset, ids):
+    '''
+    dict {id: row} of given ids, ids are sent in batches as in_bulk does
+    '''
+    ids = list(ids)
+    batch_size = connections[queryset.db].features.max_query_params or len(ids) or 1
+    rows = {}
+    for i in range(0, len(ids), batch_size):
+        rows.update((row.id, row) for row in queryset.order_by().filter(
+            pk__in=ids[i:i + batch_size]))
+    return rows
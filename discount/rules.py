@@ -0,0 +1,180 @@
+'''
+stacking of discounts of levels product, brand, category and customer,
+policy of stacking is chosen by setting
+
+DISCOUNT_STACKING = {
+    'POLICY': 'max',        # max | additive | multiplicative | priority
+    'CAP': 100,             # stacked discount never exceeds cap
+    'PRIORITY': ['product', 'brand', 'category', 'customer'],
+    'CUSTOMER': 'order',    # order: discount of customer is discount of order,
+                            # item: it is stacked with discounts of order items
+}
+
+max takes the biggest discount, additive sums discounts, multiplicative
+applies them one after another (10% and 10% give 19%, rounded down to whole
+percent), priority takes first level with discount in order of PRIORITY;
+inside of one level the biggest discount is taken by every policy
+
+discounts of exclusive campaigns (Discount.exclusive) are not stacked,
+product with current exclusive item gets the biggest exclusive discount only
+
+every policy is compiled to sql expression for objects_discount and
+to python function for order items, both give the same discounts, so
+carts of any size are priced by constant amount of queries,
+after change of policy command rebuild_discounts has to be run
+'''
+
+from functools import reduce
+import operator
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
+
+from discount.expressions import IntegerDivision, max_of, min_of
+
+
+LEVELS = ('product', 'brand', 'category', 'customer')
+
+EXCLUSIVE_RANK = 1000
+
+DEFAULTS = {
+    'POLICY': 'max',
+    'CAP': 100,
+    'PRIORITY': list(LEVELS),
+    'CUSTOMER': 'order',
+}
+
+
+def stacking_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'DISCOUNT_STACKING', {}))
+    if options['POLICY'] not in POLICIES:
+        raise ImproperlyConfigured('DISCOUNT_STACKING POLICY has to be one of {}'.format(
+            ', '.join(sorted(POLICIES))))
+    if options['CUSTOMER'] not in ('order', 'item'):
+        raise ImproperlyConfigured("DISCOUNT_STACKING CUSTOMER has to be 'order' or 'item'")
+    return options
+
+
+def customer_stacked():
+    return stacking_settings()['CUSTOMER'] == 'item'
+
+
+def by_priority(levels, options):
+    '''
+    values of dict {level: value} in order of PRIORITY
+    '''
+    priority = options['PRIORITY']
+    names = sorted(levels, key=lambda name: (
+        priority.index(name) if name in priority else len(priority)))
+    return [levels[name] for name in names]
+
+
+def multiplicative_divisor(values):
+    return 100 ** (len(values) - 1)
+
+
+def sql_multiplicative(values):
+    # 100 - ceil(remaining percent), in integers on every backend
+    remaining = reduce(operator.mul, [Value(100) - value for value in values])
+    divisor = multiplicative_divisor(values)
+    return Value(100) - IntegerDivision(remaining + Value(divisor - 1), Value(divisor))
+
+
+def python_multiplicative(values):
+    remaining = reduce(operator.mul, [100 - value for value in values])
+    return 100 - -(-remaining // multiplicative_divisor(values))
+
+
+def sql_priority(values):
+    return Case(*[When(GreaterThan(value, 0), then=value) for value in values[:-1]],
+                default=values[-1])
+
+
+def python_priority(values):
+    return next((value for value in values if value), 0)
+
+
+POLICIES = {
+    'max': (lambda values: max_of(*values), max),
+    'additive': (lambda values: reduce(operator.add, values), sum),
+    'multiplicative': (sql_multiplicative, python_multiplicative),
+    'priority': (sql_priority, python_priority),
+}
+
+
+def level_discount(rank):
+    '''
+    discount of level from its rank (see max_rank_subquery), operator %
+    keeps integers, MOD() of sqlite returns float
+    '''
+    if isinstance(rank, str):
+        rank = F(rank)
+    return rank % Value(EXCLUSIVE_RANK)
+
+
+def stacked_expression(levels, rank=None):
+    '''
+    sql expression of stacked discount, levels is dict {level: expression}
+    of integer discounts without NULL, rank is max rank of levels, with it
+    exclusive discount wins; max policy is max of ranks, so it references
+    every level once, other policies reference rank twice and every level
+    once more
+
+    django inlines expression of alias on every reference, so every
+    reference of level is its own correlated subquery: live objects_discount
+    runs 12 subqueries per row with max policy (9 before exclusive
+    campaigns), 24 with additive and multiplicative and 28 with priority,
+    materialized discounts do not run them
+    '''
+    options = stacking_settings()
+    plain_max = options['POLICY'] == 'max' and options['CAP'] >= 100
+    if rank is not None and plain_max:
+        return level_discount(rank)
+
+    expression = POLICIES[options['POLICY']][0](by_priority(levels, options))
+    if not plain_max:
+        expression = min_of(expression, Value(options['CAP']))
+
+    if rank is None:
+        return expression
+    return Case(When(GreaterThanOrEqual(rank, EXCLUSIVE_RANK),
+                     then=rank - Value(EXCLUSIVE_RANK)),
+                default=expression)
+
+
+def stacked_discount(levels):
+    '''
+    python evaluation of stacked_expression, levels is dict {level: discount}
+    '''
+    options = stacking_settings()
+    discount = POLICIES[options['POLICY']][1](by_priority(levels, options))
+    return min(discount, options['CAP'])
+
+
+def item_discount(product, customer=None):
+    '''
+    discount of order item, product has fields of Product.objects_discount,
+    customer has max_discount or is None, with CUSTOMER 'order' it is
+    discount of product
+    '''
+    if customer is None or product.exclusive or not customer_stacked():
+        return product.max_discount
+    return stacked_discount({
+        'product': product.product_discount,
+        'brand': product.brand_discount,
+        'category': product.category_discount,
+        'customer': customer.max_discount,
+    })
+
+
+def order_discount(customer):
+    '''
+    discount of order of customer, it is 0 when discount of customer
+    is stacked into discounts of items
+    '''
+    if customer is None or customer_stacked():
+        return 0
+    return customer.max_discount
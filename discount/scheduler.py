@@ -0,0 +1,139 @@
+'''
+discounts become active at valid_from and expire after valid_to,
+materialized discounts are recomputed only when one of these boundaries
+is crossed and only for products and customers of crossed discounts,
+process_boundaries is run by command process_discount_boundaries from cron
+'''
+
+from bisect import bisect_left, bisect_right
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from discount.cache import bump_generation_on_commit
+from discount.models import (
+    CustomerDiscount, Discount, DiscountSchedule, CustomerEffectiveDiscount,
+    ProductEffectiveDiscount)
+
+
+DISCOUNT = 'discount'
+CUSTOMER_DISCOUNT = 'customer_discount'
+
+BOUNDARY_MODELS = (
+    (DISCOUNT, Discount),
+    (CUSTOMER_DISCOUNT, CustomerDiscount),
+)
+
+
+class BoundaryIndex(object):
+
+    '''
+    sorted index of boundaries (time, kind, id) of validity windows,
+    valid_from is crossed when since < valid_from <= until,
+    valid_to is crossed when since <= valid_to < until
+    '''
+
+    def __init__(self, boundaries):
+        self.boundaries = sorted(boundaries)
+        self.times = [boundary[0] for boundary in self.boundaries]
+
+    def __len__(self):
+        return len(self.boundaries)
+
+    @classmethod
+    def load(cls, since, until):
+        '''
+        loads boundaries in (since, until] by indexed range queries
+        '''
+        boundaries = []
+        for kind, model in BOUNDARY_MODELS:
+            rows = model.objects.filter(
+                Q(valid_from__gt=since, valid_from__lte=until) |
+                Q(valid_to__gte=since, valid_to__lt=until)
+            ).values_list('id', 'valid_from', 'valid_to')
+            for pk, valid_from, valid_to in rows:
+                if since < valid_from <= until:
+                    boundaries.append((valid_from, kind, pk))
+                if since <= valid_to < until:
+                    boundaries.append((valid_to, kind, pk))
+        return cls(boundaries)
+
+    def next_boundary(self, after):
+        i = bisect_right(self.times, after)
+        if i < len(self.times):
+            return self.times[i]
+        return None
+
+    def crossed(self, since, until):
+        '''
+        returns dict {kind: set of ids} of boundaries between since and until
+        '''
+        result = {kind: set() for kind, model in BOUNDARY_MODELS}
+        start = bisect_left(self.times, since)
+        stop = bisect_right(self.times, until)
+        for time, kind, pk in self.boundaries[start:stop]:
+            result[kind].add(pk)
+        return result
+
+
+def next_boundary(now=None):
+    '''
+    the nearest time after now when some discount becomes active or expires,
+    None when there are no such discounts
+    '''
+    now = now or timezone.now()
+    times = []
+    for kind, model in BOUNDARY_MODELS:
+        for field in ('valid_from', 'valid_to'):
+            time = model.objects.filter(**{field + '__gt': now}).order_by(
+                field).values_list(field, flat=True).first()
+            if time is not None:
+                times.append(time)
+    return min(times) if times else None
+
+
+def process_boundaries(now=None, name='default'):
+    '''
+    recomputes materialized discounts affected by boundaries crossed since
+    previous run, on the first run all materialized discounts are rebuilt
+    '''
+    now = now or timezone.now()
+    result = {'since': None, 'until': now, 'boundaries': 0,
+              'products': 0, 'customers': 0}
+
+    with transaction.atomic():
+        schedule = DiscountSchedule.objects.select_for_update().filter(
+            name=name).first()
+
+        if schedule is None:
+            result['products'] = ProductEffectiveDiscount.objects.refresh()
+            result['customers'] = CustomerEffectiveDiscount.objects.refresh()
+            DiscountSchedule.objects.create(name=name, processed_until=now)
+            bump_generation_on_commit()
+            return result
+
+        since = schedule.processed_until
+        result['since'] = since
+        if since >= now:
+            return result
+
+        index = BoundaryIndex.load(since, now)
+        crossed = index.crossed(since, now)
+        result['boundaries'] = len(index)
+
+        if crossed[DISCOUNT]:
+            result['products'] = ProductEffectiveDiscount.objects.refresh_discounts(
+                crossed[DISCOUNT])
+        if crossed[CUSTOMER_DISCOUNT]:
+            result['customers'] = CustomerEffectiveDiscount.objects.refresh(
+                CustomerDiscount.objects.filter(
+                    id__in=crossed[CUSTOMER_DISCOUNT]).values('customer_id'))
+
+        schedule.processed_until = now
+        schedule.save(update_fields=['processed_until'])
+
+    if result['boundaries']:
+        bump_generation_on_commit()
+
+    return result
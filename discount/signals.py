@@ -0,0 +1,141 @@
+'''
+materialized discounts are updated incrementally, only rows of products
+and customers which are affected by changed object are recomputed,
+queryset.update(), bulk_create() and raw sql don't send signals,
+after them command rebuild_discounts has to be run
+'''
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from discount.cache import bump_generation_on_commit
+from discount.models import (
+    Customer, CustomerDiscount, Discount, Product, ProductDiscountItem,
+    BrandDiscountItem, CategoryDiscountItem, CustomerEffectiveDiscount,
+    ProductEffectiveDiscount)
+
+
+DISCOUNT_ITEM_FIELDS = {
+    ProductDiscountItem: 'product_id',
+    BrandDiscountItem: 'brand_id',
+    CategoryDiscountItem: 'category_id',
+}
+
+
+GENERATION_MODELS = (
+    Customer, CustomerDiscount, Product, Discount, ProductDiscountItem,
+    BrandDiscountItem, CategoryDiscountItem)
+
+
+_muted = ContextVar('discount_signals_muted', default=False)
+
+
+@contextmanager
+def muted():
+    '''
+    handlers do nothing inside, for bulk changes which do not change
+    effective discounts (see discount.compaction)
+    '''
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+
+def unless_muted(handler):
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not _muted.get():
+            return handler(*args, **kwargs)
+    return wrapper
+
+
+def refresh_discount_item(instance, ids, using):
+    field = DISCOUNT_ITEM_FIELDS[type(instance)]
+    ids = set(ids)
+    ids.add(getattr(instance, field))
+    ProductEffectiveDiscount.objects.db_manager(using).refresh_related(
+        **{field.replace('_id', '_ids'): ids})
+
+
+def old_value(instance, field, using):
+    if instance.pk is None:
+        return None
+    return type(instance)._default_manager.using(using).filter(
+        pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+@unless_muted
+def product_saved(sender, instance, using='default', **kwargs):
+    ProductEffectiveDiscount.objects.db_manager(using).refresh([instance.pk])
+
+
+@receiver(post_save, sender=Customer)
+@unless_muted
+def customer_saved(sender, instance, created, using='default', **kwargs):
+    if created:
+        CustomerEffectiveDiscount.objects.db_manager(using).refresh([instance.pk])
+
+
+@receiver(pre_save, sender=CustomerDiscount)
+def customer_discount_changing(sender, instance, using='default', **kwargs):
+    instance._old_customer_id = old_value(instance, 'customer_id', using)
+
+
+@receiver(post_save, sender=CustomerDiscount)
+@receiver(post_delete, sender=CustomerDiscount)
+@unless_muted
+def customer_discount_changed(sender, instance, using='default', **kwargs):
+    ids = {instance.customer_id, getattr(instance, '_old_customer_id', None)}
+    ids.discard(None)
+    CustomerEffectiveDiscount.objects.db_manager(using).refresh(ids)
+
+
+@receiver(pre_save, sender=ProductDiscountItem)
+@receiver(pre_save, sender=BrandDiscountItem)
+@receiver(pre_save, sender=CategoryDiscountItem)
+def discount_item_changing(sender, instance, using='default', **kwargs):
+    instance._old_target_id = old_value(instance, DISCOUNT_ITEM_FIELDS[sender], using)
+
+
+@receiver(post_save, sender=ProductDiscountItem)
+@receiver(post_delete, sender=ProductDiscountItem)
+@receiver(post_save, sender=BrandDiscountItem)
+@receiver(post_delete, sender=BrandDiscountItem)
+@receiver(post_save, sender=CategoryDiscountItem)
+@receiver(post_delete, sender=CategoryDiscountItem)
+@unless_muted
+def discount_item_changed(sender, instance, using='default', **kwargs):
+    old_id = getattr(instance, '_old_target_id', None)
+    refresh_discount_item(instance, [old_id] if old_id else [], using)
+
+
+@receiver(post_save, sender=Discount)
+@unless_muted
+def discount_saved(sender, instance, created, using='default', **kwargs):
+    '''
+    items of deleted discount are deleted by cascade with their own signals
+    '''
+    if created:
+        return
+    ProductEffectiveDiscount.objects.db_manager(using).refresh_discounts([instance.pk])
+
+
+@unless_muted
+def discount_data_changed(sender, using='default', **kwargs):
+    '''
+    cached discounts of all workers become stale after commit
+    '''
+    bump_generation_on_commit(using)
+
+
+for model in GENERATION_MODELS:
+    post_save.connect(discount_data_changed, sender=model,
+                      dispatch_uid='discount_generation_save_{}'.format(model.__name__))
+    post_delete.connect(discount_data_changed, sender=model,
+                        dispatch_uid='discount_generation_delete_{}'.format(model.__name__))
@@ -0,0 +1,69 @@
+'''
+startup benchmark, cold start of process is measured in fresh interpreter:
+django.setup(), first discount_for (connection, compilation of sql, query)
+and second discount_for, command benchmark_startup runs it several times
+
+this module must not import django or discount models at import time
+'''
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def main():
+    '''
+    runs in child process, prints json with seconds of phases
+    '''
+    started = time.perf_counter()
+    import django
+    django.setup()
+    setup = time.perf_counter() - started
+
+    from discount.models import Product
+
+    pk = Product.objects.order_by().values_list('pk', flat=True).first()
+    lookups = []
+    for i in range(2):
+        started = time.perf_counter()
+        Product.objects.discount_for(pk)
+        lookups.append(time.perf_counter() - started)
+
+    json.dump({
+        'setup': setup,
+        'first_lookup': lookups[0],
+        'next_lookup': lookups[1],
+        'modules': len(sys.modules),
+        'numpy_loaded': 'numpy' in sys.modules,
+    }, sys.stdout)
+
+
+def run(runs=5, settings_module=None):
+    '''
+    dict with median and min of every phase of runs child processes
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path)
+    if settings_module:
+        env['DJANGO_SETTINGS_MODULE'] = settings_module
+
+    results = []
+    for i in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', 'from discount.startup import main; main()'],
+            env=env, check=True, stdout=subprocess.PIPE).stdout
+        result = json.loads(output)
+        result['process'] = time.perf_counter() - started
+        results.append(result)
+
+    summary = {'runs': runs, 'modules': results[-1]['modules'],
+               'numpy_loaded': results[-1]['numpy_loaded']}
+    for phase in ('process', 'setup', 'first_lookup', 'next_lookup'):
+        values = [result[phase] for result in results]
+        summary[phase] = {'median': round(statistics.median(values), 6),
+                          'min': round(min(values), 6)}
+    return summary
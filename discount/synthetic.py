@@ -0,0 +1,116 @@
+'''
+reproducible synthetic catalogues for benchmarks, the same seed and sizes
+give the same data, rows are inserted by bulk_create, so signals are not
+sent and materialized discounts have to be rebuilt afterwards
+'''
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from discount.models import (
+    Brand, BrandDiscountItem, Category, CategoryDiscountItem, Customer,
+    CustomerDiscount, Discount, Order, OrderItem, Product, ProductDiscountItem)
+
+
+BATCH_SIZE = 2000
+
+
+def default_sizes(products):
+    return {
+        'products': products,
+        'brands': max(10, products // 100),
+        'categories': max(10, products // 200),
+        'campaigns': max(5, products // 10000),
+        'customers': max(10, products // 10),
+        'orders': max(10, products // 100),
+        'order_items': 5,
+    }
+
+
+def insert(model, objects):
+    '''
+    inserts objects by batches and returns list of their ids
+    '''
+    start = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    objects = list(objects)
+    for i in range(0, len(objects), BATCH_SIZE):
+        model.objects.bulk_create(objects[i:i + BATCH_SIZE])
+    return list(model.objects.filter(pk__gt=start).order_by('pk').values_list(
+        'pk', flat=True))
+
+
+def generate(products, seed=0, now=None, **sizes):
+    '''
+    creates brands, categories, products, overlapping discount campaigns
+    with product, brand and category items, customers with discounts and
+    orders, returns dict with amounts of created rows
+    '''
+    options = default_sizes(products)
+    options.update(sizes)
+    rnd = random.Random(seed)
+    now = now or timezone.now()
+
+    def window():
+        start = now + timedelta(days=rnd.randint(-30, 10), hours=rnd.randint(0, 23))
+        return start, start + timedelta(days=rnd.randint(1, 40))
+
+    with transaction.atomic():
+        brand_ids = insert(Brand, (
+            Brand(name='brand {}'.format(i)) for i in range(options['brands'])))
+        category_ids = insert(Category, (
+            Category(name='category {}'.format(i)) for i in range(options['categories'])))
+        product_ids = insert(Product, (
+            Product(name='product {}'.format(i),
+                    price=Decimal(rnd.randint(100, 1000000)) / 100,
+                    brand_id=rnd.choice(brand_ids),
+                    category_id=rnd.choice(category_ids))
+            for i in range(options['products'])))
+
+        discount_ids = []
+        for i in range(options['campaigns']):
+            valid_from, valid_to = window()
+            discount_ids.append(Discount.objects.create(
+                valid_from=valid_from, valid_to=valid_to).pk)
+
+        per_campaign = max(1, len(product_ids) // 20 // len(discount_ids))
+        insert(ProductDiscountItem, (
+            ProductDiscountItem(head_id=head_id, product_id=product_id,
+                                discount=rnd.randint(1, 50))
+            for head_id in discount_ids
+            for product_id in rnd.sample(product_ids, min(per_campaign, len(product_ids)))))
+        insert(BrandDiscountItem, (
+            BrandDiscountItem(head_id=head_id, brand_id=brand_id,
+                              discount=rnd.randint(1, 30))
+            for head_id in discount_ids
+            for brand_id in rnd.sample(brand_ids, max(1, len(brand_ids) // 10))))
+        insert(CategoryDiscountItem, (
+            CategoryDiscountItem(head_id=head_id, category_id=category_id,
+                                 discount=rnd.randint(1, 30))
+            for head_id in discount_ids
+            for category_id in rnd.sample(category_ids, max(1, len(category_ids) // 10))))
+
+        customer_ids = insert(Customer, (
+            Customer(name='customer {}'.format(i)) for i in range(options['customers'])))
+
+        def customer_discount(customer_id):
+            valid_from, valid_to = window()
+            return CustomerDiscount(customer_id=customer_id, valid_from=valid_from,
+                                    valid_to=valid_to, discount=rnd.randint(1, 20))
+
+        insert(CustomerDiscount, (
+            customer_discount(customer_id)
+            for customer_id in customer_ids for k in range(rnd.randint(0, 2))))
+
+        order_ids = insert(Order, (
+            Order(customer_id=rnd.choice(customer_ids))
+            for i in range(options['orders'])))
+        insert(OrderItem, (
+            OrderItem(order_id=order_id, product_id=rnd.choice(product_ids),
+                      quantity=rnd.randint(1, 10))
+            for order_id in order_ids for k in range(options['order_items'])))
+
+    return options
@@ -0,0 +1,50 @@
+'''
+data of tests: small catalogue with campaigns on every level, objects are
+created in database using
+'''
+
+from datetime import timedelta
+from decimal import Decimal
+
+from discount.models import (
+    Brand, BrandDiscountItem, Category, CategoryDiscountItem, Discount, Product,
+    ProductDiscountItem)
+
+
+PRICES = ('10.00', '19.99', '176.80', '0.99', '45.50', '1234.56', '1.15')
+
+
+def catalogue(prices=PRICES, using='default'):
+    '''
+    two categories and two brands, products are spread over all their
+    pairs, returns lists of categories, brands and products
+    '''
+    categories = [Category.objects.using(using).create(name='category {}'.format(i))
+                  for i in range(2)]
+    brands = [Brand.objects.using(using).create(name='brand {}'.format(i)) for i in range(2)]
+    products = [
+        Product.objects.using(using).create(
+            name='product {}'.format(i), price=Decimal(price),
+            brand=brands[i % 2], category=categories[i // 2 % 2])
+        for i, price in enumerate(prices)
+    ]
+    return categories, brands, products
+
+
+def campaign(start, days, exclusive=False, products=None, brands=None, categories=None,
+             using='default'):
+    '''
+    campaign valid from start for given days, products, brands and
+    categories are dicts {object: discount}
+    '''
+    head = Discount.objects.using(using).create(
+        valid_from=start, valid_to=start + timedelta(days=days), exclusive=exclusive)
+    for product, discount in (products or {}).items():
+        ProductDiscountItem.objects.using(using).create(
+            head=head, product=product, discount=discount)
+    for brand, discount in (brands or {}).items():
+        BrandDiscountItem.objects.using(using).create(head=head, brand=brand, discount=discount)
+    for category, discount in (categories or {}).items():
+        CategoryDiscountItem.objects.using(using).create(
+            head=head, category=category, discount=discount)
+    return head
@@ -0,0 +1,201 @@
+import asyncio
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+from django.utils import timezone
+
+from discount.batching import DiscountLoader, get_loader
+from discount.models import Customer, Order, Product
+from discount.tests.data import campaign, catalogue
+
+
+class Fetch(object):
+    
+    '''
+    fetch of loader which records requested ids and waits for release
+    '''
+    
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+        self.released = None
+    
+    def event(self):
+        # event is bound to loop of test, it is created in it
+        if self.released is None:
+            self.released = asyncio.Event()
+        return self.released
+    
+    async def __call__(self, ids):
+        self.calls.append(sorted(ids))
+        await self.event().wait()
+        if self.error is not None:
+            raise self.error
+        return {pk: {'pk': pk} for pk in ids if pk > 0}
+    
+    def release(self):
+        self.event().set()
+
+
+async def settle():
+    '''
+    lets loader dispatch pending ids and fetch start
+    '''
+    for i in range(3):
+        await asyncio.sleep(0)
+
+
+class DiscountLoaderTest(TestCase):
+    
+    def test_inflight_ids_are_not_fetched_again(self):
+        fetch = Fetch()
+        
+        async def run():
+            loader = DiscountLoader(fetch)
+            first = asyncio.ensure_future(loader.load_many([1, 2]))
+            await settle()
+            second = asyncio.ensure_future(loader.load_many([2, 3]))
+            await settle()
+            fetch.release()
+            return await first, await second
+        
+        first, second = async_to_sync(run)()
+        
+        self.assertEqual(fetch.calls, [[1, 2], [3]])
+        self.assertEqual(first, {1: {'pk': 1}, 2: {'pk': 2}})
+        self.assertEqual(second, {2: {'pk': 2}, 3: {'pk': 3}})
+        # every caller gets own copy
+        self.assertIsNot(first[2], second[2])
+    
+    def test_error_is_raised_to_every_waiter(self):
+        fetch = Fetch(ValueError('fetch failed'))
+        
+        async def run():
+            loader = DiscountLoader(fetch)
+            fetch.release()
+            return await asyncio.gather(loader.load_many([1]), loader.load_many([1, 2]),
+                                        return_exceptions=True)
+        
+        results = async_to_sync(run)()
+        
+        self.assertEqual(fetch.calls, [[1, 2]])
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+    
+    def test_cancelled_waiter_does_not_cancel_others(self):
+        fetch = Fetch()
+        
+        async def run():
+            loader = DiscountLoader(fetch)
+            cancelled = asyncio.ensure_future(loader.load_many([1]))
+            waiting = asyncio.ensure_future(loader.load_many([1]))
+            await settle()
+            cancelled.cancel()
+            await settle()
+            fetch.release()
+            return cancelled, await waiting
+        
+        cancelled, result = async_to_sync(run)()
+        
+        self.assertTrue(cancelled.cancelled())
+        self.assertEqual(result, {1: {'pk': 1}})
+        self.assertEqual(fetch.calls, [[1]])
+    
+    def test_missing_id_is_left_out(self):
+        fetch = Fetch()
+        
+        async def run():
+            loader = DiscountLoader(fetch)
+            fetch.release()
+            return await loader.load_many([1, -1])
+        
+        self.assertEqual(async_to_sync(run)(), {1: {'pk': 1}})
+    
+    def test_loaders_are_kept_per_event_loop(self):
+        async def loaders():
+            return get_loader(Product.objects), get_loader(Product.objects)
+        
+        first, same = async_to_sync(loaders)()
+        other, other_same = async_to_sync(loaders)()
+        
+        self.assertIs(first, same)
+        self.assertIs(other, other_same)
+        self.assertIsNot(first, other)
+    
+    def test_loaders_are_kept_per_model(self):
+        async def loaders():
+            return get_loader(Product.objects), get_loader(Customer.objects)
+        
+        product_loader, customer_loader = async_to_sync(loaders)()
+        
+        self.assertIsNot(product_loader, customer_loader)
+
+
+class AsyncDiscountTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        categories, brands, cls.products = catalogue()
+        campaign(timezone.now() - timedelta(days=1), 10,
+                 products={cls.products[0]: 20}, brands={brands[1]: 5})
+        cls.customer = Customer.objects.create(name='customer')
+        cls.ids = [product.pk for product in cls.products]
+    
+    def test_concurrent_lookups_are_one_query(self):
+        async def run():
+            return await asyncio.gather(
+                *[Product.objects.adiscount_for(pk) for pk in self.ids],
+                Product.objects.adiscount_for(self.ids[:3]))
+        
+        with self.assertNumQueries(1):
+            results = async_to_sync(run)()
+        
+        expected = Product.objects.discount_for(self.ids)
+        self.assertEqual([obj.max_discount for obj in results[:-1]],
+                         [expected[pk].max_discount for pk in self.ids])
+        self.assertEqual(sorted(results[-1]), self.ids[:3])
+        self.assertEqual(results[0].max_discount, 20)
+    
+    def test_missing_id_returns_none(self):
+        missing = max(self.ids) + 1
+        
+        async def run():
+            return (await Product.objects.adiscount_for(missing),
+                    await Product.objects.adiscount_for([self.ids[0], missing]))
+        
+        one, many = async_to_sync(run)()
+        
+        self.assertIsNone(one)
+        self.assertEqual(list(many), [self.ids[0]])
+    
+    def test_iterables_are_batches(self):
+        queryset = Product.objects.filter(pk__in=self.ids[:3]).values_list('pk', flat=True)
+        
+        async def run():
+            return (await Product.objects.adiscount_for(pk for pk in self.ids[:3]),
+                    await Product.objects.adiscount_for(queryset))
+        
+        for objects in async_to_sync(run)():
+            self.assertEqual(sorted(objects), self.ids[:3])
+    
+    def test_acreate_with_items_prices_as_create_with_items(self):
+        items = [(self.ids[0], 2), (self.ids[1], 1), (self.ids[3], 4)]
+        
+        order = async_to_sync(Order.objects.acreate_with_items)(self.customer, items)
+        expected = Order.objects.create_with_items(self.customer, items)
+        
+        def figures(order):
+            return sorted(order.items.values_list('product', 'quantity', 'price', 'discount'))
+        
+        self.assertEqual(order.customer, self.customer)
+        self.assertEqual(figures(order), figures(expected))
+        self.assertEqual(order.total_cost(), expected.total_cost())
+    
+    def test_acreate_with_missing_product_raises(self):
+        missing = max(self.ids) + 1
+        
+        with self.assertRaises(Product.DoesNotExist):
+            async_to_sync(Order.objects.acreate_with_items)(self.customer, [(missing, 1)])
+        self.assertFalse(Order.objects.exists())
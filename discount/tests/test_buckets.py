@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from discount.buckets import bucket_counts, bucket_filter, price_buckets
+from discount.models import Product, ProductEffectiveDiscount
+from discount.tests.data import PRICES, campaign, catalogue
+
+
+BUCKETS = [(0, 10), (10, 100), (100, None)]
+
+
+@override_settings(DISCOUNT_PRICE_BUCKETS=BUCKETS)
+class PriceBucketTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        # prices on both edges of bucket from 10 to 100
+        categories, brands, cls.products = catalogue(PRICES + ('100.00', '200.00'))
+        # 200.00 - 50% is 100.00
+        campaign(timezone.now() - timedelta(days=1), 10, products={cls.products[-1]: 50})
+    
+    def prices(self, queryset, key):
+        return sorted(bucket_filter(queryset, 'discount_price', key).values_list(
+            'price', flat=True))
+    
+    def test_buckets_of_setting(self):
+        self.assertEqual(price_buckets(), [
+            ('from_0_to_10', 'From 0 to 10', 0, 10),
+            ('from_10_to_100', 'From 10 to 100', 10, 100),
+            ('from_100', 'From 100', 100, None),
+        ])
+    
+    def test_lower_bound_is_included_upper_is_excluded(self):
+        queryset = Product.objects.objects_discount(materialized=False)
+        
+        self.assertEqual([str(price) for price in self.prices(queryset, 'from_0_to_10')],
+                         ['0.99', '1.15'])
+        self.assertEqual([str(price) for price in self.prices(queryset, 'from_10_to_100')],
+                         ['10.00', '19.99', '45.50'])
+        # top bucket has no upper bound
+        self.assertEqual([str(price) for price in self.prices(queryset, 'from_100')],
+                         ['100.00', '176.80', '200.00', '1234.56'])
+    
+    def test_unknown_key_does_not_filter(self):
+        queryset = Product.objects.objects_discount(materialized=False)
+        
+        self.assertEqual(bucket_filter(queryset, 'discount_price', 'from_5').count(),
+                         len(self.products))
+    
+    def test_counts_are_one_query(self):
+        expected = {'from_0_to_10': 2, 'from_10_to_100': 3, 'from_100': 4}
+        
+        with self.assertNumQueries(1):
+            counts = bucket_counts(Product.objects.objects_discount(materialized=False),
+                                   'discount_price')
+        self.assertEqual(counts, expected)
+        
+        ProductEffectiveDiscount.objects.refresh()
+        with self.assertNumQueries(1):
+            counts = bucket_counts(ProductEffectiveDiscount.objects.all(), 'discount_price')
+        self.assertEqual(counts, expected)
+    
+    @override_settings(DISCOUNT_PRICE_BUCKETS=[(0, 10)])
+    def test_rows_out_of_buckets(self):
+        counts = bucket_counts(Product.objects.objects_discount(materialized=False),
+                               'discount_price')
+        
+        self.assertEqual(counts, {'from_0_to_10': 2, '': len(self.products) - 2})
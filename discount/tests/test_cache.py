@@ -0,0 +1,77 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from discount.cache import get_discount_cache, get_generation, reset_discount_cache
+from discount.models import Product, ProductDiscountItem
+from discount.tests.data import campaign, catalogue
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                        'LOCATION': 'discount-tests'}},
+    DISCOUNT_CACHE={'ENABLED': True},
+)
+class CacheInvalidationTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        categories, brands, cls.products = catalogue()
+        cls.head = campaign(timezone.now() - timedelta(days=1), 10,
+                            products={cls.products[0]: 20})
+    
+    def setUp(self):
+        caches['default'].clear()
+        reset_discount_cache('DISCOUNT_CACHE')
+        self.cache = get_discount_cache()
+        self.pk = self.products[0].pk
+    
+    def discount(self):
+        return Product.objects.discount_for(self.pk).max_discount
+    
+    def test_lookups_are_cached(self):
+        self.assertEqual(self.discount(), 20)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.discount(), 20)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+    
+    def test_write_invalidates_after_commit(self):
+        self.assertEqual(self.discount(), 20)
+        generation = get_generation()
+        
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            ProductDiscountItem.objects.create(head=self.head, product=self.products[0],
+                                               discount=45)
+            # other workers still read previous commit
+            self.assertEqual(get_generation(), generation)
+        
+        self.assertTrue(callbacks)
+        self.assertEqual(get_generation(), generation + 1)
+        self.assertEqual(self.discount(), 45)
+    
+    def test_lookup_of_older_generation_is_not_stored(self):
+        found, missing, generation = self.cache.get_many(Product, [self.pk])
+        fetched = Product.objects.fetch_discounts(missing)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductDiscountItem.objects.create(head=self.head, product=self.products[0],
+                                               discount=45)
+        self.cache.sync()
+        
+        self.cache.set_many(Product, fetched, generation)
+        
+        self.assertEqual(self.cache.entries, {})
+        self.assertEqual(self.discount(), 45)
+    
+    def test_rebuild_discounts_invalidates(self):
+        self.assertEqual(self.discount(), 20)
+        ProductDiscountItem.objects.filter(head=self.head).update(discount=35)
+        self.assertEqual(self.discount(), 20)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_discounts', stdout=StringIO())
+        
+        self.assertEqual(self.discount(), 35)
@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from discount.compaction import compact
+from discount.engine import iter_prices
+from discount.models import ArchivedDiscount, Discount, Product, ProductEffectiveDiscount
+from discount.scheduler import process_boundaries
+from discount.tests.data import campaign, catalogue
+
+
+FIELDS = ('product_discount', 'brand_discount', 'category_discount', 'exclusive',
+          'max_discount', 'discount_price')
+
+
+def point_at(points, at):
+    return [point for point in points if point.at <= at][-1]
+
+
+class CompactionTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        categories, brands, products = catalogue()
+        cls.ids = [product.pk for product in products]
+        day = timedelta(days=1)
+        # expired campaigns, they are archived by compact
+        campaign(cls.now - 30 * day, 20, products={products[0]: 30}, categories={categories[0]: 5})
+        campaign(cls.now - 20 * day, 15, exclusive=True, brands={brands[1]: 12})
+        campaign(cls.now - 12 * day, 4, categories={categories[1]: 25})
+        # current campaigns, the second one is dominated
+        campaign(cls.now - day, 10, products={products[1]: 10}, brands={brands[0]: 7})
+        campaign(cls.now - day, 5, products={products[1]: 8})
+        campaign(cls.now + 3 * day, 10, exclusive=True, categories={categories[0]: 40})
+        cls.moments = [cls.now + days * day for days in (-25, -15, -9, -6, 0, 4)]
+    
+    def discounts_at(self, at):
+        return {
+            pk: tuple(getattr(product, field) for field in FIELDS)
+            for pk, product in Product.objects.discount_for(self.ids, at=at).items()
+        }
+    
+    def snapshot(self):
+        return {
+            at: self.discounts_at(at) for at in self.moments
+        }
+    
+    def timelines(self):
+        return Product.objects.timeline(self.ids, self.moments[0], self.moments[-1])
+    
+    def assert_agrees_with_timeline(self):
+        timelines = self.timelines()
+        for at in self.moments:
+            discounts = self.discounts_at(at)
+            for pk in self.ids:
+                point = point_at(timelines[pk], at)
+                self.assertEqual(discounts[pk], tuple(getattr(point, field) for field in FIELDS),
+                                 (pk, at))
+    
+    def test_discounts_at_time_survive_compaction(self):
+        before = self.snapshot()
+        timelines = self.timelines()
+        self.assert_agrees_with_timeline()
+        
+        stats = compact()
+        
+        self.assertEqual(stats['archived'], 3)
+        self.assertEqual(stats['dominated'], 1)
+        self.assertEqual(ArchivedDiscount.objects.count(), 3)
+        self.assertEqual(Discount.objects.count(), 3)
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(self.timelines(), timelines)
+        self.assert_agrees_with_timeline()
+    
+    def test_engine_at_time_survives_compaction(self):
+        at = self.moments[1]
+        before = list(iter_prices(use_numpy=False, at=at))
+        
+        compact()
+        
+        self.assertEqual(list(iter_prices(use_numpy=False, at=at)), before)
+        self.assertEqual({row[0]: row[2:] for row in before}, self.discounts_at(at))
+
+
+class CompactionSchedulerTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        categories, brands, cls.products = catalogue()
+        cls.head = campaign(cls.now - timedelta(days=1), 10, products={cls.products[0]: 30})
+    
+    def materialized(self):
+        return ProductEffectiveDiscount.objects.get(product=self.products[0]).max_discount
+    
+    def test_unprocessed_expiry_is_not_archived(self):
+        process_boundaries(self.now - timedelta(hours=1))
+        # campaign expires after the last run of scheduler, materialized
+        # discount is stale until scheduler processes the expiry
+        Discount.objects.filter(pk=self.head.pk).update(valid_to=self.now - timedelta(minutes=30))
+        self.assertEqual(self.materialized(), 30)
+        
+        self.assertEqual(compact()['archived'], 0)
+        
+        result = process_boundaries()
+        self.assertEqual(result['boundaries'], 1)
+        self.assertEqual(self.materialized(), 0)
+        self.assertEqual(compact()['archived'], 1)
+        self.assertEqual(self.materialized(), 0)
+        self.assertEqual(process_boundaries()['products'], 0)
@@ -0,0 +1,78 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from discount import compiled
+from discount.models import Order, Product
+from discount.tests.data import catalogue
+
+
+class CompiledLookupTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = [product.pk for product in catalogue()[2]]
+    
+    def assert_same(self, objects, ids):
+        expected = Product.objects.objects_discount(materialized=False).in_bulk(ids)
+        self.assertEqual(
+            {pk: (obj.max_discount, obj.discount_price) for pk, obj in objects.items()},
+            {pk: (obj.max_discount, obj.discount_price) for pk, obj in expected.items()})
+    
+    def big_lookup_queries(self, size):
+        max_params = connection.features.max_query_params
+        if not max_params:
+            return 1
+        key = (Product._meta.label, 'default', connection.vendor, False, compiled.settings_key())
+        batch_size = max_params - (len(compiled.compiled_lookup(*key, 1).params) - 1)
+        return -(-size // batch_size)
+    
+    def test_small_lookup_is_one_query(self):
+        with self.assertNumQueries(1):
+            objects = compiled.fetch(Product.objects, self.ids[:3] + [0], False)
+        self.assert_same(objects, self.ids[:3])
+    
+    def test_big_lookup_is_not_split_by_max_size(self):
+        ids = self.ids + list(range(10 ** 6, 10 ** 6 + 3000))
+        
+        with self.assertNumQueries(self.big_lookup_queries(len(ids))):
+            objects = compiled.fetch(Product.objects, ids, False)
+        
+        self.assert_same(objects, self.ids)
+    
+    @override_settings(DISCOUNT_STACKING={'POLICY': 'additive'})
+    def test_big_cart(self):
+        product = Product.objects.get(pk=self.ids[0])
+        Product.objects.bulk_create([
+            Product(name='bulk {}'.format(i), price=product.price, brand_id=product.brand_id,
+                    category_id=product.category_id)
+            for i in range(3000)])
+        items = [(pk, 2) for pk in Product.objects.values_list('pk', flat=True)]
+        
+        with self.assertNumQueries(self.big_lookup_queries(len(items))):
+            priced = Order.objects.price_items(None, items)
+        
+        self.assertEqual(len(priced), len(items))
+
+
+class DiscountForBatchTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = [product.pk for product in catalogue()[2]]
+    
+    def test_iterables_are_batches(self):
+        queryset = Product.objects.filter(pk__in=self.ids[:3]).values_list('pk', flat=True)
+        batches = [
+            (pk for pk in self.ids[:3]),
+            range(self.ids[0], self.ids[2] + 1),
+            dict.fromkeys(self.ids[:3]).keys(),
+            queryset,
+        ]
+        for ids in batches:
+            with self.subTest(ids=type(ids).__name__):
+                objects = Product.objects.discount_for(ids)
+                
+                self.assertEqual(sorted(objects), self.ids[:3])
+    
+    def test_one_id(self):
+        self.assertEqual(Product.objects.discount_for(self.ids[0]).pk, self.ids[0])
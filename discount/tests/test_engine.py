@@ -0,0 +1,62 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+
+from discount import signals
+from discount.models import CustomerEffectiveDiscount, ProductEffectiveDiscount
+from discount.tests.data import PRICES, campaign, catalogue
+
+
+class WriteMaterializedTest(TestCase):
+    
+    '''
+    materialized discounts written by the pricing engine are the discounts
+    of live computation, as rebuild_discounts verifies them
+    '''
+    
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        categories, brands, cls.products = catalogue()
+        with signals.muted():
+            campaign(now - timedelta(days=1), 10, products={cls.products[0]: 20},
+                     brands={brands[1]: 15}, categories={categories[0]: 5})
+            campaign(now - timedelta(days=2), 10, exclusive=True,
+                     products={cls.products[5]: 7})
+            campaign(now - timedelta(days=20), 10, products={cls.products[1]: 50})
+        CustomerEffectiveDiscount.objects.refresh()
+    
+    def verify(self):
+        out, err = StringIO(), StringIO()
+        call_command('rebuild_discounts', '--verify-only', stdout=out, stderr=err)
+        return out.getvalue()
+    
+    def test_written_discounts_pass_verification(self):
+        for options in ([], ['--no-numpy']):
+            with self.subTest(options=options):
+                ProductEffectiveDiscount.objects.all().delete()
+                err = StringIO()
+                
+                with self.captureOnCommitCallbacks(execute=True):
+                    call_command('reprice_catalogue', '--write', '--chunk-size', '3',
+                                 *options, stderr=err)
+                
+                self.assertTrue(err.getvalue().startswith('{} products priced'.format(
+                    len(PRICES))))
+                self.assertEqual(ProductEffectiveDiscount.objects.count(), len(PRICES))
+                self.assertIn('up to date', self.verify())
+    
+    def test_stale_rows_fail_verification(self):
+        with self.assertRaises(CommandError):
+            self.verify()
+        
+        call_command('reprice_catalogue', '--write', stderr=StringIO())
+        ProductEffectiveDiscount.objects.filter(product=self.products[2]).update(
+            max_discount=99)
+        
+        with self.assertRaisesMessage(CommandError, '1 rows differ'):
+            self.verify()
@@ -0,0 +1,96 @@
+import csv
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import Permission, User
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from discount.export import EXPORT_FIELDS, export_lines, iter_products
+from discount.models import Product
+from discount.tests.data import PRICES, campaign, catalogue
+from discount.views import product_export
+
+
+class ExportTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        categories, brands, cls.products = catalogue()
+        campaign(timezone.now() - timedelta(days=1), 10, products={cls.products[1]: 33},
+                 brands={brands[0]: 10})
+    
+    def expected(self):
+        return [
+            (product.pk, product.name, product.brand.name, product.category.name,
+             product.price.quantize(Decimal('0.01')), product.product_discount,
+             product.brand_discount, product.category_discount, product.max_discount,
+             product.discount_price.quantize(Decimal('0.01')))
+            for product in Product.objects.objects_discount(materialized=False).select_related(
+                'brand', 'category').order_by('pk')
+        ]
+    
+    def test_chunks_are_read_by_keyset(self):
+        # 7 products in chunks of 2 and the last empty chunk
+        with self.assertNumQueries(5):
+            rows = list(iter_products(chunk_size=2, materialized=False))
+        
+        self.assertEqual(rows, self.expected())
+        self.assertEqual(len(rows), len(PRICES))
+    
+    def test_chunk_as_big_as_catalogue(self):
+        with self.assertNumQueries(2):
+            rows = list(iter_products(chunk_size=len(PRICES), materialized=False))
+        
+        self.assertEqual(rows, self.expected())
+    
+    def test_csv(self):
+        lines = list(export_lines('csv', chunk_size=3, materialized=False))
+        
+        rows = list(csv.reader(StringIO(''.join(lines))))
+        self.assertEqual(rows[0], EXPORT_FIELDS)
+        self.assertEqual(rows[1:], [[str(value) for value in row] for row in self.expected()])
+    
+    def test_jsonl(self):
+        lines = list(export_lines('jsonl', chunk_size=3, materialized=False))
+        
+        self.assertEqual(len(lines), len(PRICES))
+        self.assertTrue(all(line.endswith('\n') for line in lines))
+        self.assertEqual([json.loads(line) for line in lines], [
+            dict(zip(EXPORT_FIELDS, [
+                str(value) if isinstance(value, Decimal) else value for value in row]))
+            for row in self.expected()
+        ])
+
+
+class ProductExportViewTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        catalogue()
+        cls.user = User.objects.create(username='export')
+        cls.user.user_permissions.add(Permission.objects.get(
+            content_type__app_label='discount', codename='view_product'))
+    
+    def get(self, **query):
+        request = RequestFactory().get('/products/export/', query)
+        request.user = User.objects.get(pk=self.user.pk)
+        return product_export(request)
+    
+    def test_formats(self):
+        for format, content_type, lines in (('csv', 'text/csv', len(PRICES) + 1),
+                                            ('jsonl', 'application/x-ndjson', len(PRICES))):
+            with self.subTest(format=format):
+                response = self.get(format=format)
+                
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], content_type)
+                self.assertEqual(response['Content-Disposition'],
+                                 'attachment; filename="products.{}"'.format(format))
+                content = b''.join(response.streaming_content).decode()
+                self.assertEqual(len(content.splitlines()), lines)
+    
+    def test_unknown_format(self):
+        self.assertEqual(self.get(format='xml').status_code, 400)
@@ -0,0 +1,90 @@
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from discount.instrumentation import DiscountInstrumentationMiddleware, discount_resolved
+from discount.models import Customer, Order, Product
+from discount.tests.data import catalogue
+
+
+class InstrumentationTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = [product.pk for product in catalogue()[2]]
+    
+    def test_discount_for_reports_returned_rows(self):
+        received = []
+        
+        def receiver(sender, **stats):
+            received.append(stats)
+        
+        discount_resolved.connect(receiver)
+        try:
+            Product.objects.discount_for(self.ids[:4] + [0])
+        finally:
+            discount_resolved.disconnect(receiver)
+        
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]['api'], 'Product.discount_for')
+        self.assertEqual(received[0]['rows_returned'], 4)
+        self.assertEqual(received[0]['queries'], 1)
+        self.assertNotIn('rows', received[0])
+
+
+class MiddlewareTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = [product.pk for product in catalogue()[2]]
+        cls.customer = Customer.objects.create(name='customer')
+    
+    def request(self, view):
+        def get_response(request):
+            view()
+            return HttpResponse()
+        
+        middleware = DiscountInstrumentationMiddleware(get_response)
+        with CaptureQueriesContext(connection) as queries:
+            response = middleware(RequestFactory().get('/prices/'))
+        return response, queries
+    
+    def test_headers_are_totals_of_request(self):
+        def view():
+            Product.objects.discount_for(self.ids[:3] + [0])
+            # items are priced by discount_for, Order.save is nested in create_with_items
+            Order.objects.create_with_items(self.customer, [(self.ids[4], 1)])
+        
+        received = []
+        
+        def receiver(sender, **stats):
+            received.append(stats)
+        
+        discount_resolved.connect(receiver)
+        try:
+            response, queries = self.request(view)
+        finally:
+            discount_resolved.disconnect(receiver)
+        
+        self.assertEqual(response['X-Discount-Calls'], '3')
+        self.assertEqual(response['X-Discount-Queries'], str(len(queries)))
+        # captured queries have parameters filled in, sizes of sql are sent by signal
+        self.assertEqual(response['X-Discount-Sql-Bytes'], str(sum(
+            stats['sql_bytes'] for stats in received if not stats['nested'])))
+        self.assertEqual(response['X-Discount-Rows'], '4')
+        self.assertEqual(response['X-Discount-Cache'], '0/0')
+        self.assertGreater(float(response['X-Discount-Time']), 0)
+    
+    def test_request_without_discounts_has_no_headers(self):
+        response, queries = self.request(lambda: None)
+        
+        self.assertFalse(response.has_header('X-Discount-Calls'))
+    
+    @override_settings(DISCOUNT_INSTRUMENTATION={'HEADERS': False, 'BUDGET': {'queries': 0}})
+    def test_budget(self):
+        with self.assertLogs('discount.instrumentation', 'WARNING') as logs:
+            response, queries = self.request(lambda: Product.objects.discount_for(self.ids))
+        
+        self.assertFalse(response.has_header('X-Discount-Queries'))
+        self.assertIn('discount budget exceeded (queries) GET /prices/', logs.output[0])
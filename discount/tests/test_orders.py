@@ -0,0 +1,32 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from discount.models import Customer, CustomerDiscount, Order
+from discount.tests.data import campaign, catalogue
+
+
+class OrderTotalTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        categories, brands, products = catalogue()
+        campaign(now - timedelta(days=1), 10, products={products[2]: 3, products[4]: 7},
+                 brands={brands[1]: 11})
+        cls.customer = Customer.objects.create(name='customer')
+        CustomerDiscount.objects.create(customer=cls.customer, discount=3,
+                                        valid_from=now - timedelta(days=1),
+                                        valid_to=now + timedelta(days=10))
+        cls.order = Order.objects.create_with_items(cls.customer, [
+            (products[2].pk, 1), (products[4].pk, 3), (products[1].pk, 7)])
+    
+    def test_total_cost_is_rounded_as_with_totals(self):
+        order = Order.objects.get(pk=self.order.pk)
+        annotated = Order.objects.with_totals().get(pk=self.order.pk)
+        
+        self.assertEqual(order.total_cost(), annotated.total_cost())
+        self.assertEqual(order.total_cost(), order.total_cost().quantize(Decimal('0.01')))
+        self.assertEqual(order.total_cost().as_tuple().exponent, -2)
@@ -0,0 +1,32 @@
+from django.test import TestCase, override_settings
+
+from discount.models import Product, ProductEffectiveDiscount
+from discount.paginator import DiscountPaginator, counted_model
+from discount.tests.data import PRICES, catalogue
+
+
+class PaginatorCountTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        catalogue()
+        # product without materialized discounts is not listed by materialized list
+        ProductEffectiveDiscount.objects.filter(product=Product.objects.first()).delete()
+    
+    def count(self, queryset):
+        return DiscountPaginator(queryset, 2, unfiltered=True).count
+    
+    def test_live_list_counts_products(self):
+        queryset = Product.objects.objects_discount(materialized=False).order_by('pk')
+        
+        self.assertIs(counted_model(queryset), Product)
+        self.assertEqual(self.count(queryset), len(PRICES))
+        self.assertEqual(self.count(queryset), queryset.count())
+    
+    @override_settings(DISCOUNT_MATERIALIZED=True)
+    def test_materialized_list_counts_materialized_discounts(self):
+        queryset = Product.objects.objects_discount().order_by('pk')
+        
+        self.assertIs(counted_model(queryset), ProductEffectiveDiscount)
+        self.assertEqual(self.count(queryset), len(PRICES) - 1)
+        self.assertEqual(self.count(queryset), queryset.count())
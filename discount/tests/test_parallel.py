@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from discount import parallel, signals
+from discount.models import Brand, Category, Product, ProductEffectiveDiscount
+from discount.tests.data import campaign, catalogue
+
+
+FIELDS = ('product_id', 'product_discount', 'brand_discount', 'category_discount',
+          'exclusive', 'max_discount', 'discount_price')
+
+
+class PartitionTest(TestCase):
+    
+    def lookups(self, partitions):
+        return [partition.lookups for partition in partitions]
+    
+    def sizes(self, partitions):
+        return [Product.objects.filter(**partition.lookups).count() for partition in partitions]
+    
+    def test_id_partitions_are_balanced_and_open_ended(self):
+        categories, brands, products = catalogue()
+        ids = [product.pk for product in products]
+        
+        partitions = parallel.make_partitions('id', 3)
+        
+        self.assertEqual(self.lookups(partitions), [
+            {'pk__lt': ids[2]},
+            {'pk__gte': ids[2], 'pk__lt': ids[4]},
+            {'pk__gte': ids[4]},
+        ])
+        self.assertEqual(self.sizes(partitions), [2, 2, 3])
+        # products created later belong to the last partition
+        Product.objects.create(name='new', price=Decimal('1.00'), brand=brands[0],
+                               category=categories[0])
+        self.assertEqual(self.sizes(partitions), [2, 2, 4])
+    
+    def test_id_partitions_of_empty_catalogue(self):
+        partitions = parallel.make_partitions('id', 4)
+        
+        self.assertEqual(self.lookups(partitions), [{}])
+    
+    def test_brand_partitions_are_balanced(self):
+        category = Category.objects.create(name='category')
+        brands = [Brand.objects.create(name='brand {}'.format(i)) for i in range(3)]
+        for brand, size in zip(brands, (5, 3, 2)):
+            for i in range(size):
+                Product.objects.create(name='product', price=Decimal('1.00'), brand=brand,
+                                       category=category)
+        
+        partitions = parallel.make_partitions('brand', 2)
+        
+        self.assertEqual(self.lookups(partitions), [
+            {'brand_id__in': [brands[0].pk]},
+            {'brand_id__in': sorted([brands[1].pk, brands[2].pk])},
+        ])
+        self.assertEqual(self.sizes(partitions), [5, 5])
+        # groups are not split, so partitions beyond groups are left out
+        self.assertEqual(len(parallel.make_partitions('brand', 5)), 3)
+    
+    def test_unknown_key(self):
+        with self.assertRaises(ValueError):
+            parallel.make_partitions('price')
+
+
+class RecomputeTest(TestCase):
+    
+    '''
+    recompute with one worker runs in this process, so it sees data of test
+    '''
+    
+    @classmethod
+    def setUpTestData(cls):
+        categories, brands, cls.products = catalogue()
+        with signals.muted():
+            campaign(timezone.now() - timedelta(days=1), 10,
+                     products={cls.products[0]: 20, cls.products[3]: 7},
+                     brands={brands[1]: 5}, categories={categories[1]: 12})
+    
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.state_path = os.path.join(directory, 'state.json')
+    
+    def materialized(self):
+        return list(ProductEffectiveDiscount.objects.order_by('product_id').values_list(*FIELDS))
+    
+    def live(self):
+        rows = Product.objects.objects_discount(materialized=False).order_by('pk')
+        return [tuple(getattr(ProductEffectiveDiscount.from_object(row), field)
+                      for field in FIELDS) for row in rows]
+    
+    def recompute(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return parallel.recompute(workers=1, partitions=3, state_path=self.state_path,
+                                      chunk_size=2, **kwargs)
+    
+    def test_rows_are_live_discounts(self):
+        ProductEffectiveDiscount.objects.filter(product=self.products[1]).update(
+            max_discount=99, discount_price=Decimal('0.01'))
+        
+        stats = self.recompute()
+        
+        self.assertEqual((stats['partitions'], stats['skipped'], stats['products']),
+                         (3, 0, len(self.products)))
+        self.assertEqual(stats['failed'], {})
+        self.assertEqual(self.materialized(), self.live())
+        self.assertFalse(os.path.exists(self.state_path))
+    
+    def test_brand_partitions(self):
+        stats = self.recompute(by='brand')
+        
+        self.assertEqual(stats['partitions'], 2)
+        self.assertEqual(self.materialized(), self.live())
+    
+    def test_failure_keeps_state_and_resume_skips_finished(self):
+        recompute_partition = parallel.recompute_partition
+        
+        def failing(partition, chunk_size):
+            if 'pk__lt' not in partition.lookups:
+                raise RuntimeError('partition failed')
+            return recompute_partition(partition, chunk_size)
+        
+        with mock.patch('discount.parallel.recompute_partition', failing):
+            stats = self.recompute()
+        
+        self.assertEqual(list(stats['failed']), ['id:{}-'.format(self.products[4].pk)])
+        self.assertTrue(os.path.exists(self.state_path))
+        with open(self.state_path) as state_file:
+            state = json.load(state_file)
+        self.assertEqual(sorted(state['done']), sorted(
+            'id:{}-{}'.format(low, high) for low, high in (
+                ('', self.products[2].pk), (self.products[2].pk, self.products[4].pk))))
+        
+        with mock.patch('discount.parallel.recompute_partition',
+                        wraps=recompute_partition) as recomputed:
+            stats = self.recompute(resume=True)
+        
+        self.assertEqual((stats['partitions'], stats['skipped'], stats['products']), (3, 2, 3))
+        self.assertEqual(recomputed.call_count, 1)
+        self.assertEqual(self.materialized(), self.live())
+        self.assertFalse(os.path.exists(self.state_path))
@@ -0,0 +1,163 @@
+'''
+parity of discounts: live and materialized objects_discount, discount_for
+of both and rows are compared with discounts computed by hand for every
+stacking policy; the same tests run on postgresql when settings have
+database alias postgresql
+'''
+
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from discount.models import (
+    Customer, CustomerDiscount, CustomerEffectiveDiscount, Product, ProductEffectiveDiscount)
+from discount.tests.data import PRICES, campaign, catalogue
+
+
+POSTGRESQL = 'postgresql'
+
+FIELDS = ('product_discount', 'brand_discount', 'category_discount', 'exclusive',
+          'max_discount', 'discount_price')
+
+# (product, brand, category, exclusive) discounts of products of catalogue
+LEVELS = [
+    (20, 10, 12, False),
+    (0, 25, 12, False),
+    (5, 10, 15, False),
+    (0, 25, 15, False),
+    (0, 10, 12, False),
+    (30, 25, 12, True),
+    (70, 10, 15, False),
+]
+
+# stacked discounts of products of catalogue
+MAX = [20, 25, 15, 25, 12, 30, 70]
+ADDITIVE = [42, 37, 30, 40, 22, 30, 95]
+MULTIPLICATIVE = [36, 34, 27, 36, 20, 30, 77]
+PRIORITY = [20, 25, 5, 25, 10, 30, 70]
+ADDITIVE_CAPPED = [35, 35, 30, 35, 22, 30, 35]
+CATEGORY_FIRST = [12, 12, 15, 15, 12, 30, 15]
+
+CUSTOMER_DISCOUNTS = [8, 0, 0]
+
+
+def postgresql_configured():
+    return POSTGRESQL in settings.DATABASES and connections[POSTGRESQL].vendor == 'postgresql'
+
+
+def expected_discounts(stacked):
+    return [
+        levels + (discount, (Decimal(price) * (100 - discount) / 100).quantize(
+            Decimal('0.01'), ROUND_HALF_UP))
+        for price, levels, discount in zip(PRICES, LEVELS, stacked)
+    ]
+
+
+def values(objects):
+    return [tuple(getattr(obj, field) for field in FIELDS) for obj in objects]
+
+
+class ParityTest(TestCase):
+    
+    using = 'default'
+    databases = {'default'}
+    
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        day = timedelta(days=1)
+        categories, brands, products = catalogue(using=cls.using)
+        cls.ids = [product.pk for product in products]
+        
+        campaign(now - day, 10, products={products[0]: 20, products[2]: 5, products[6]: 70},
+                 brands={brands[0]: 10}, categories={categories[1]: 15}, using=cls.using)
+        campaign(now - day, 10, exclusive=True, products={products[5]: 30}, using=cls.using)
+        campaign(now - day, 10, brands={brands[1]: 25}, categories={categories[0]: 12},
+                 using=cls.using)
+        # expired and future campaigns are not counted
+        campaign(now - 10 * day, 5, products={products[1]: 50}, using=cls.using)
+        campaign(now + 2 * day, 5, exclusive=True, categories={categories[0]: 40},
+                 using=cls.using)
+        
+        customers = [Customer.objects.using(cls.using).create(name='customer {}'.format(i))
+                     for i in range(3)]
+        cls.customer_ids = [customer.pk for customer in customers]
+        for customer, start, discount in ((customers[0], now - day, 5),
+                                          (customers[0], now - day, 8),
+                                          (customers[0], now - 10 * day, 20),
+                                          (customers[2], now + 2 * day, 30)):
+            CustomerDiscount.objects.using(cls.using).create(
+                customer=customer, valid_from=start, valid_to=start + 5 * day,
+                discount=discount)
+    
+    def product_results(self):
+        '''
+        discounts of all ways of reading them, materialized discounts
+        are recomputed by current stacking settings
+        '''
+        manager = Product.objects.db_manager(self.using)
+        ProductEffectiveDiscount.objects.db_manager(self.using).refresh()
+        results = {
+            'live': values(manager.objects_discount(materialized=False).order_by('pk')),
+            'materialized': values(manager.objects_discount(materialized=True).order_by('pk')),
+            'rows': values(manager.rows(materialized=False).order_by('pk')),
+            'discount_for': values(manager.discount_for(self.ids)[pk] for pk in self.ids),
+        }
+        with override_settings(DISCOUNT_MATERIALIZED=True):
+            results['materialized discount_for'] = values(
+                manager.discount_for(self.ids)[pk] for pk in self.ids)
+        return results
+    
+    def assert_parity(self, stacked):
+        expected = expected_discounts(stacked)
+        for name, result in self.product_results().items():
+            self.assertEqual(result, expected, name)
+    
+    def test_max(self):
+        self.assert_parity(MAX)
+    
+    @override_settings(DISCOUNT_STACKING={'POLICY': 'additive'})
+    def test_additive(self):
+        self.assert_parity(ADDITIVE)
+    
+    @override_settings(DISCOUNT_STACKING={'POLICY': 'multiplicative'})
+    def test_multiplicative(self):
+        self.assert_parity(MULTIPLICATIVE)
+    
+    @override_settings(DISCOUNT_STACKING={'POLICY': 'priority'})
+    def test_priority(self):
+        self.assert_parity(PRIORITY)
+    
+    @override_settings(DISCOUNT_STACKING={'POLICY': 'additive', 'CAP': 35})
+    def test_cap(self):
+        self.assert_parity(ADDITIVE_CAPPED)
+    
+    @override_settings(DISCOUNT_STACKING={
+        'POLICY': 'priority', 'PRIORITY': ['category', 'brand', 'product', 'customer']})
+    def test_priority_order(self):
+        self.assert_parity(CATEGORY_FIRST)
+    
+    def test_customers(self):
+        manager = Customer.objects.db_manager(self.using)
+        CustomerEffectiveDiscount.objects.db_manager(self.using).refresh()
+        live = manager.objects_discount(materialized=False).order_by('pk')
+        materialized = manager.objects_discount(materialized=True).order_by('pk')
+        
+        self.assertEqual([obj.max_discount for obj in live], CUSTOMER_DISCOUNTS)
+        self.assertEqual([obj.max_discount for obj in materialized], CUSTOMER_DISCOUNTS)
+        found = manager.discount_for(self.customer_ids)
+        self.assertEqual([found[pk].max_discount for pk in self.customer_ids],
+                         CUSTOMER_DISCOUNTS)
+
+
+@skipUnless(postgresql_configured(), 'database alias postgresql is not configured')
+class PostgreSQLParityTest(ParityTest):
+    
+    using = POSTGRESQL
+    # runner checks databases of skipped tests too
+    databases = {POSTGRESQL} if postgresql_configured() else set()
@@ -0,0 +1,127 @@
+import json
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from unittest import mock
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import caches
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+
+from discount.models import Customer, CustomerDiscount, Product, ProductDiscountItem
+from discount.pricelist import MAX_LIMIT
+from discount.rules import item_discount, order_discount
+from discount.tests.data import PRICES, campaign, catalogue
+from discount.views import customer_price_list
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                        'LOCATION': 'discount-tests'}},
+)
+class CustomerPriceListTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        categories, brands, cls.products = catalogue()
+        cls.head = campaign(cls.now - timedelta(days=1), 10,
+                            products={cls.products[0]: 20, cls.products[2]: 7},
+                            brands={brands[1]: 5})
+        # boundary of price lists
+        campaign(cls.now + timedelta(hours=1), 10, products={cls.products[3]: 30})
+        cls.customer = Customer.objects.create(name='customer')
+        CustomerDiscount.objects.create(customer=cls.customer, discount=3,
+                                        valid_from=cls.now - timedelta(days=1),
+                                        valid_to=cls.now + timedelta(days=10))
+        cls.user = User.objects.create(username='prices')
+        cls.user.user_permissions.add(Permission.objects.get(
+            content_type__app_label='discount', codename='view_customer'))
+    
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.get(pk=self.user.pk)
+    
+    def get(self, customer_id=None, **headers):
+        query = headers.pop('data', {})
+        request = RequestFactory().get('/customers/prices/', query, **headers)
+        request.user = self.user
+        return customer_price_list(request, customer_id or self.customer.pk)
+    
+    def results(self, response):
+        return json.loads(response.content)
+    
+    def test_prices_are_discounts_of_items_and_order(self):
+        response = self.get()
+        
+        self.assertEqual(response.status_code, 200)
+        data = self.results(response)
+        customer = Customer.objects.discount_for(self.customer.pk)
+        products = Product.objects.discount_for([product.pk for product in self.products])
+        self.assertEqual(data['customer_discount'], 3)
+        self.assertEqual(len(data['results']), len(PRICES))
+        for result in data['results']:
+            prod = products[result['id']]
+            discount = item_discount(prod, customer)
+            self.assertEqual(result['discount'], discount)
+            self.assertEqual(result['order_discount'], order_discount(customer))
+            price = prod.price * (100 - discount) * (100 - order_discount(customer)) / 10000
+            self.assertEqual(Decimal(result['customer_price']),
+                             price.quantize(Decimal('0.01'), ROUND_HALF_UP))
+        self.assertEqual(data['results'][0]['discount'], 20)
+    
+    def test_pages_are_read_by_keyset(self):
+        data = self.results(self.get(data={'limit': 3}))
+        
+        self.assertEqual([result['id'] for result in data['results']],
+                         [product.pk for product in self.products[:3]])
+        self.assertEqual(data['next'], '/customers/prices/?after={}&limit=3'.format(
+            self.products[2].pk))
+        
+        data = self.results(self.get(data={'after': self.products[2].pk, 'limit': 3}))
+        self.assertEqual(data['results'][0]['id'], self.products[3].pk)
+    
+    def test_not_modified_without_queries_of_discounts(self):
+        response = self.get()
+        etag, modified = response['ETag'], response['Last-Modified']
+        
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+    
+    def test_etag_changes_after_write_of_discount(self):
+        etag = self.get()['ETag']
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductDiscountItem.objects.create(head=self.head, product=self.products[1],
+                                               discount=45)
+        
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        prices = {result['id']: result for result in self.results(response)['results']}
+        self.assertEqual(prices[self.products[1].pk]['discount'], 45)
+    
+    def test_etag_changes_after_boundary(self):
+        etag = self.get()['ETag']
+        boundary = self.now + timedelta(hours=1)
+        
+        with mock.patch('django.utils.timezone.now', return_value=boundary + timedelta(seconds=1)):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['Last-Modified'],
+                         http_date(boundary.replace(microsecond=0).timestamp()))
+    
+    def test_missing_customer(self):
+        with self.assertRaises(Http404):
+            self.get(Customer.objects.order_by('pk').last().pk + 1)
+    
+    def test_bad_limit(self):
+        for limit in ('0', str(MAX_LIMIT + 1), 'ten'):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.get(data={'limit': limit}).status_code, 400)
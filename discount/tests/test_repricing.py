@@ -0,0 +1,138 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from discount import signals
+from discount.models import (
+    Customer, CustomerDiscount, Order, Product, ProductEffectiveDiscount)
+from discount.repricing import reprice_items_sql, reprice_orders
+from discount.tests.data import campaign, catalogue
+
+
+class RepricingTest(TestCase):
+    
+    '''
+    repriced orders and items get the same prices and discounts as
+    Order.save and OrderItem.save would set, paid orders are kept
+    '''
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        categories, brands, cls.products = catalogue()
+        campaign(cls.now - timedelta(days=1), 10, products={cls.products[0]: 20})
+        cls.customer = Customer.objects.create(name='customer')
+        cls.other = Customer.objects.create(name='other')
+        cls.customer_discount = CustomerDiscount.objects.create(
+            customer=cls.customer, discount=3, valid_from=cls.now - timedelta(days=1),
+            valid_to=cls.now + timedelta(days=10))
+    
+    def orders(self):
+        products = self.products
+        self.unpaid = Order.objects.create_with_items(self.customer, [
+            (products[0].pk, 1), (products[1].pk, 2), (products[3].pk, 3)])
+        self.paid = Order.objects.create_with_items(self.customer, [
+            (products[0].pk, 1), (products[3].pk, 1)])
+        Order.objects.filter(pk=self.paid.pk).update(paid=True)
+        self.untouched = Order.objects.create_with_items(self.other, [(products[1].pk, 1)])
+    
+    def change_discounts(self):
+        campaign(self.now - timedelta(days=1), 10, products={self.products[0]: 40})
+        Product.objects.filter(pk=self.products[3].pk).update(price=Decimal('2.49'))
+        self.customer_discount.discount = 8
+        self.customer_discount.save()
+    
+    def figures(self, order):
+        items = order.items.order_by('pk').values_list('price', 'discount')
+        return Order.objects.get(pk=order.pk).discount, list(items)
+    
+    def assertSavedFigures(self, order):
+        '''
+        Order.save and OrderItem.save do not change repriced order
+        '''
+        repriced = self.figures(order)
+        for item in order.items.all():
+            item.save()
+        Order.objects.get(pk=order.pk).save()
+        self.assertEqual(self.figures(order), repriced)
+    
+    def test_sql_path(self):
+        self.orders()
+        paid = self.figures(self.paid)
+        self.change_discounts()
+        
+        stats = reprice_orders()
+        
+        self.assertEqual((stats['orders'], stats['changed_orders'], stats['changed_items']),
+                         (2, 1, 2))
+        discount, items = self.figures(self.unpaid)
+        self.assertEqual(discount, 8)
+        self.assertEqual(items[0][1], 40)
+        self.assertEqual(items[2][0], Decimal('2.49'))
+        self.assertSavedFigures(self.unpaid)
+        self.assertSavedFigures(self.untouched)
+        self.assertEqual(self.figures(self.paid), paid)
+    
+    @override_settings(DISCOUNT_STACKING={'CUSTOMER': 'item'})
+    def test_python_path(self):
+        self.orders()
+        paid = self.figures(self.paid)
+        self.change_discounts()
+        
+        stats = reprice_orders()
+        
+        # discount of customer is in every item of its order
+        self.assertEqual((stats['orders'], stats['changed_orders'], stats['changed_items']),
+                         (2, 1, 3))
+        discount, items = self.figures(self.unpaid)
+        self.assertEqual(discount, 0)
+        self.assertEqual([item[1] for item in items], [40, 8, 8])
+        self.assertSavedFigures(self.unpaid)
+        self.assertSavedFigures(self.untouched)
+        self.assertEqual(self.figures(self.paid), paid)
+    
+    def test_repriced_orders_are_not_changed_again(self):
+        self.orders()
+        self.change_discounts()
+        reprice_orders()
+        
+        stats = reprice_orders()
+        
+        self.assertEqual((stats['orders'], stats['changed_orders'], stats['changed_items']),
+                         (2, 0, 0))
+    
+    def test_orders_of_given_products(self):
+        self.orders()
+        Product.objects.filter(pk=self.products[3].pk).update(price=Decimal('2.49'))
+        
+        stats = reprice_orders(product_ids=[self.products[3].pk])
+        
+        self.assertEqual((stats['orders'], stats['changed_orders'], stats['changed_items']),
+                         (1, 1, 1))
+    
+    def test_sql_items_return_exact_counts(self):
+        self.orders()
+        self.change_discounts()
+        order_ids = [self.unpaid.pk, self.untouched.pk]
+        
+        with self.assertNumQueries(2):
+            self.assertEqual(reprice_items_sql(order_ids), (2, {self.unpaid.pk}))
+        with self.assertNumQueries(1):
+            self.assertEqual(reprice_items_sql(order_ids), (0, set()))
+    
+    @override_settings(DISCOUNT_MATERIALIZED=True)
+    def test_missing_materialized_discount_is_computed_live(self):
+        self.orders()
+        with signals.muted():
+            campaign(self.now - timedelta(days=1), 10, products={self.products[0]: 40})
+        ProductEffectiveDiscount.objects.refresh()
+        ProductEffectiveDiscount.objects.filter(product=self.products[0]).delete()
+        
+        stats = reprice_orders()
+        
+        self.assertEqual(stats['changed_items'], 1)
+        discount, items = self.figures(self.unpaid)
+        self.assertEqual(items[0][1], 40)
+        self.assertSavedFigures(self.unpaid)
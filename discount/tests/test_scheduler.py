@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from discount import signals
+from discount.cache import get_generation
+from discount.models import (
+    Customer, CustomerDiscount, DiscountSchedule, Product, ProductEffectiveDiscount)
+from discount.scheduler import (
+    CUSTOMER_DISCOUNT, DISCOUNT, BoundaryIndex, next_boundary, process_boundaries)
+from discount.tests.data import campaign, catalogue
+
+
+class BoundaryTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.since = timezone.now() - timedelta(days=100)
+        cls.until = cls.since + timedelta(hours=1)
+        categories, brands, products = catalogue()
+        customer = Customer.objects.create(name='customer')
+        hour = timedelta(hours=1)
+        cls.heads = [
+            campaign(cls.since, 1, products={products[0]: 10}),
+            campaign(cls.until, 1, products={products[0]: 10}),
+            campaign(cls.since - hour, 0, products={products[0]: 10}),
+            campaign(cls.since - 2 * hour, 0, products={products[0]: 10}),
+        ]
+        # windows of these end at since and until
+        cls.heads[2].valid_to = cls.since
+        cls.heads[2].save()
+        cls.heads[3].valid_to = cls.until
+        cls.heads[3].save()
+        cls.customer_discount = CustomerDiscount.objects.create(
+            customer=customer, valid_from=cls.since + timedelta(minutes=1),
+            valid_to=cls.until + timedelta(days=1), discount=5)
+    
+    def test_crossed_boundaries(self):
+        '''
+        valid_from is crossed when since < valid_from <= until, valid_to
+        when since <= valid_to < until
+        '''
+        index = BoundaryIndex.load(self.since, self.until)
+        
+        self.assertEqual(index.crossed(self.since, self.until), {
+            DISCOUNT: {self.heads[1].pk, self.heads[2].pk},
+            CUSTOMER_DISCOUNT: {self.customer_discount.pk},
+        })
+        self.assertEqual(index.next_boundary(self.since), self.customer_discount.valid_from)
+        self.assertIsNone(index.next_boundary(self.until))
+    
+    def test_next_boundary(self):
+        self.assertEqual(next_boundary(self.since), self.customer_discount.valid_from)
+        self.assertEqual(next_boundary(self.customer_discount.valid_from), self.until)
+        self.assertEqual(next_boundary(self.until), self.heads[0].valid_to)
+
+
+class ProcessBoundariesTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.brands, cls.products = catalogue()
+        cls.customers = [Customer.objects.create(name='customer {}'.format(i)) for i in range(2)]
+    
+    def refreshed_since(self, moment):
+        return set(ProductEffectiveDiscount.objects.filter(updated__gte=moment).values_list(
+            'product_id', flat=True))
+    
+    def test_first_run_rebuilds_everything(self):
+        start = timezone.now() - timedelta(hours=1)
+        
+        result = process_boundaries(start)
+        
+        self.assertIsNone(result['since'])
+        self.assertEqual(result['products'], len(self.products))
+        self.assertEqual(result['customers'], len(self.customers))
+        self.assertEqual(DiscountSchedule.objects.get(name='default').processed_until, start)
+    
+    def test_crossed_discounts_are_recomputed(self):
+        start = timezone.now() - timedelta(hours=1)
+        process_boundaries(start)
+        minute = timedelta(minutes=1)
+        # changes without signals, materialized discounts stay stale until
+        # scheduler crosses their boundaries
+        with signals.muted():
+            campaign(start + 10 * minute, 2, products={self.products[0]: 25})
+            ended = campaign(start - timedelta(days=1), 1, brands={self.brands[1]: 5})
+            ended.valid_to = start + 20 * minute
+            ended.save()
+            campaign(timezone.now() + timedelta(days=1), 1, products={self.products[2]: 40})
+            CustomerDiscount.objects.create(
+                customer=self.customers[1], valid_from=start + 30 * minute,
+                valid_to=start + timedelta(days=1), discount=7)
+        moment = timezone.now()
+        generation = get_generation()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            result = process_boundaries()
+        
+        self.assertEqual(result['since'], start)
+        self.assertEqual(result['boundaries'], 3)
+        self.assertEqual(self.refreshed_since(moment), {self.products[0].pk} | {
+            product.pk for product in self.products if product.brand_id == self.brands[1].pk})
+        self.assertEqual(result['customers'], 1)
+        self.assertEqual(Product.objects.objects_discount(materialized=True).get(
+            pk=self.products[0].pk).max_discount, 25)
+        self.assertEqual(Customer.objects.objects_discount(materialized=True).get(
+            pk=self.customers[1].pk).max_discount, 7)
+        self.assertEqual(get_generation(), generation + 1)
+    
+    def test_nothing_to_process(self):
+        now = timezone.now()
+        process_boundaries(now)
+        generation = get_generation()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            result = process_boundaries(now)
+        
+        self.assertEqual(result['since'], now)
+        self.assertEqual(result['boundaries'], 0)
+        self.assertEqual(get_generation(), generation)
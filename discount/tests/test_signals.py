@@ -0,0 +1,115 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from discount import signals
+from discount.models import (
+    BrandDiscountItem, Customer, CustomerDiscount, Product, ProductDiscountItem)
+from discount.tests.data import campaign, catalogue
+
+
+FIELDS = ('product_discount', 'brand_discount', 'category_discount', 'exclusive',
+          'max_discount', 'discount_price')
+
+
+def discounts(materialized):
+    return {
+        obj.pk: tuple(getattr(obj, field) for field in FIELDS)
+        for obj in Product.objects.objects_discount(materialized=materialized)
+    }
+
+
+def customer_discounts(materialized):
+    return dict(Customer.objects.objects_discount(materialized=materialized).values_list(
+        'pk', 'max_discount'))
+
+
+class MaterializationTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        cls.categories, cls.brands, cls.products = catalogue()
+        cls.head = campaign(cls.now - timedelta(days=1), 10,
+                            products={cls.products[0]: 20}, brands={cls.brands[0]: 10})
+        cls.customers = [Customer.objects.create(name='customer {}'.format(i)) for i in range(2)]
+    
+    def assert_materialized(self):
+        self.assertEqual(discounts(True), discounts(False))
+        self.assertEqual(customer_discounts(True), customer_discounts(False))
+    
+    def test_created_objects_are_materialized(self):
+        self.assertEqual(len(discounts(True)), len(self.products))
+        self.assertEqual(discounts(True)[self.products[0].pk][4], 20)
+        self.assertEqual(customer_discounts(True), {customer.pk: 0 for customer in self.customers})
+        self.assert_materialized()
+    
+    def test_item_changes(self):
+        item = ProductDiscountItem.objects.create(head=self.head, product=self.products[1],
+                                                  discount=35)
+        self.assertEqual(discounts(True)[self.products[1].pk][4], 35)
+        
+        item.product = self.products[2]
+        item.save()
+        self.assertEqual(discounts(True)[self.products[1].pk][4], 0)
+        self.assertEqual(discounts(True)[self.products[2].pk][4], 35)
+        self.assert_materialized()
+        
+        item.delete()
+        self.assertEqual(discounts(True)[self.products[2].pk][4], 10)
+        self.assert_materialized()
+    
+    def test_moved_brand_item_refreshes_both_brands(self):
+        item = BrandDiscountItem.objects.get(head=self.head)
+        item.brand = self.brands[1]
+        item.save()
+        
+        self.assertEqual(discounts(True)[self.products[1].pk][1], 10)
+        self.assertEqual(discounts(True)[self.products[2].pk][1], 0)
+        self.assert_materialized()
+    
+    def test_discount_window_and_delete(self):
+        self.head.valid_from = self.now + timedelta(days=1)
+        self.head.save()
+        self.assertEqual(discounts(True)[self.products[0].pk][4], 0)
+        self.assert_materialized()
+        
+        self.head.valid_from = self.now - timedelta(days=1)
+        self.head.save()
+        self.assertEqual(discounts(True)[self.products[0].pk][4], 20)
+        
+        self.head.delete()
+        self.assertEqual(discounts(True)[self.products[0].pk][4], 0)
+        self.assert_materialized()
+    
+    def test_product_moved_to_other_brand(self):
+        product = self.products[1]
+        product.brand = self.brands[0]
+        product.save()
+        
+        self.assertEqual(discounts(True)[product.pk][1], 10)
+        self.assert_materialized()
+    
+    def test_customer_discounts(self):
+        discount = CustomerDiscount.objects.create(
+            customer=self.customers[0], valid_from=self.now - timedelta(days=1),
+            valid_to=self.now + timedelta(days=1), discount=15)
+        self.assertEqual(customer_discounts(True)[self.customers[0].pk], 15)
+        
+        discount.customer = self.customers[1]
+        discount.save()
+        self.assertEqual(customer_discounts(True), {
+            self.customers[0].pk: 0, self.customers[1].pk: 15})
+        
+        discount.delete()
+        self.assertEqual(customer_discounts(True)[self.customers[1].pk], 0)
+        self.assert_materialized()
+    
+    def test_muted_signals_do_not_refresh(self):
+        with signals.muted():
+            ProductDiscountItem.objects.create(head=self.head, product=self.products[3],
+                                               discount=40)
+        
+        self.assertEqual(discounts(True)[self.products[3].pk][4], 0)
+        self.assertEqual(discounts(False)[self.products[3].pk][4], 40)
@@ -0,0 +1,76 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from discount.engine import iter_prices, numpy
+from discount.models import Brand, Category, Product
+from discount.rules import stacked_discount
+from discount.tests.data import campaign
+
+
+SETTINGS = [
+    {'POLICY': 'max'},
+    {'POLICY': 'max', 'CAP': 30},
+    {'POLICY': 'additive'},
+    {'POLICY': 'additive', 'CAP': 50},
+    {'POLICY': 'multiplicative'},
+    {'POLICY': 'priority'},
+    {'POLICY': 'priority', 'PRIORITY': ['brand', 'category', 'product']},
+]
+
+
+class StackingParityTest(TestCase):
+    
+    '''
+    sql expressions of policies give the same discounts as python
+    functions of discount.rules and as the pricing engine
+    '''
+    
+    @classmethod
+    def setUpTestData(cls):
+        rnd = random.Random(16)
+        now = timezone.now()
+        categories = [Category.objects.create(name='category {}'.format(i)) for i in range(3)]
+        brands = [Brand.objects.create(name='brand {}'.format(i)) for i in range(4)]
+        products = [
+            Product.objects.create(
+                name='product {}'.format(i), price=Decimal(rnd.randint(1, 200000)) / 100,
+                brand=rnd.choice(brands), category=rnd.choice(categories))
+            for i in range(60)
+        ]
+        for exclusive in (False, False, False, True):
+            campaign(now - timedelta(days=rnd.randint(1, 5)), 10, exclusive=exclusive,
+                     products={product: rnd.randint(1, 60)
+                               for product in rnd.sample(products, 6 if exclusive else 25)},
+                     brands={brand: rnd.randint(1, 60) for brand in rnd.sample(brands, 2)},
+                     categories={category: rnd.randint(1, 60)
+                                 for category in rnd.sample(categories, 1)})
+    
+    def live(self):
+        return list(Product.objects.rows(materialized=False).order_by('pk'))
+    
+    def test_sql_and_python(self):
+        for options in SETTINGS:
+            with self.subTest(**options), override_settings(DISCOUNT_STACKING=options):
+                rows = self.live()
+                self.assertTrue(any(row.exclusive for row in rows))
+                for row in rows:
+                    if row.exclusive:
+                        continue
+                    self.assertEqual(row.max_discount, stacked_discount({
+                        'product': row.product_discount,
+                        'brand': row.brand_discount,
+                        'category': row.category_discount,
+                    }), row)
+    
+    def test_sql_and_engine(self):
+        engines = [False, True] if numpy is not None else [False]
+        for options in SETTINGS:
+            with override_settings(DISCOUNT_STACKING=options):
+                rows = [tuple(row) for row in self.live()]
+                for use_numpy in engines:
+                    with self.subTest(use_numpy=use_numpy, **options):
+                        self.assertEqual(list(iter_prices(use_numpy=use_numpy)), rows)
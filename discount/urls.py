@@ -0,0 +1,10 @@
+from django.urls import path
+from discount import views
+
+app_name = 'discount'
+
+urlpatterns = [
+    path('products/export/', views.product_export, name='product_export'),
+    path('customers/<int:customer_id>/prices/', views.customer_price_list,
+         name='customer_price_list'),
+]
@@ -1,3 +1,81 @@
-from django.shortcuts import render
+from django.contrib.auth.decorators import permission_required
+from django.http import (
+    Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse)
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
 
-# Create your views here.
+from discount.export import FORMATS, export_lines
+from discount.models import Customer
+from discount.pricelist import (
+    MAX_LIMIT, customer_prices, price_list_etag, price_list_state)
+
+
+@permission_required('discount.view_product', raise_exception=True)
+def product_export(request):
+    '''
+    streams price list of all products with discounts as csv or json lines,
+    ?format=csv|jsonl
+    '''
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        return HttpResponseBadRequest('Unknown format {}'.format(format))
+    
+    response = StreamingHttpResponse(export_lines(format),
+                                     content_type=FORMATS[format][1])
+    response['Content-Disposition'] = 'attachment; filename="products.{}"'.format(format)
+    return response
+
+
+def request_state(request):
+    '''
+    version of discounts is read once per request by etag and last modified
+    '''
+    if not hasattr(request, '_discount_state'):
+        request._discount_state = price_list_state()
+    return request._discount_state
+
+
+def price_list_etag_func(request, customer_id):
+    return price_list_etag(request_state(request))
+
+
+def price_list_modified_func(request, customer_id):
+    return request_state(request)['modified']
+
+
+@require_safe
+@permission_required('discount.view_customer', raise_exception=True)
+@condition(etag_func=price_list_etag_func, last_modified_func=price_list_modified_func)
+def customer_price_list(request, customer_id):
+    '''
+    json price list of customer with combined discounts, pages are read by
+    keyset: ?after=<id of last product>&limit=100, ETag and Last-Modified
+    change with discounts, so conditional requests get 304 without
+    queries of discounts
+    '''
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = int(request.GET.get('limit', 100))
+    except ValueError:
+        return HttpResponseBadRequest('after and limit have to be integers')
+    if not 0 < limit <= MAX_LIMIT:
+        return HttpResponseBadRequest('limit has to be from 1 to {}'.format(MAX_LIMIT))
+    
+    customer = Customer.objects.discount_for(customer_id)
+    if customer is None:
+        raise Http404('Customer {} does not exist'.format(customer_id))
+    
+    prices = customer_prices(customer, after, limit)
+    next_page = None
+    if len(prices) == limit:
+        next_page = '{}?after={}&limit={}'.format(request.path, prices[-1]['id'], limit)
+    
+    response = JsonResponse({
+        'customer': customer.pk,
+        'customer_discount': customer.max_discount,
+        'results': prices,
+        'next': next_page,
+    })
+    # discounts can change at any time, caches have to revalidate by etag
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    return response